@@ -0,0 +1,195 @@
+# app/analytics.py
+from app import db, question_bank
+from app.models import AnalyticsWatermark, QuestionResponse, QuestionStats
+from app.response_codec import decode_answer, option_list
+from sqlalchemy import select
+import json
+
+JOB_NAME = 'question_stats'
+TIME_BUCKETS = 31  # Whole seconds 0..30; the question timer runs for 30 seconds
+# QuestionResponse columns the aggregates are built from
+STATS_COLUMNS = ['id', 'question_id', 'topic', 'level', 'user_answer', 'is_correct', 'time_taken',
+                 'option_set_id', 'answer_index']
+
+
+def update_question_stats(chunk_size=50000):
+    """Fold responses recorded since the last run into QuestionStats.
+
+    Responses are read in id order, `chunk_size` rows at a time, and
+    aggregated with pandas. Each chunk's totals are committed together with
+    the advanced watermark, so an interrupted run resumes where it stopped
+    without counting anything twice. Returns the number of responses read.
+    """
+    # pandas is slow to import; keep it out of the web process
+    import pandas as pd
+
+    watermark = db.session.get(AnalyticsWatermark, JOB_NAME)
+    if watermark is None:
+        watermark = AnalyticsWatermark(name=JOB_NAME, last_id=0)
+        db.session.add(watermark)
+
+    processed = 0
+    while True:
+        query = select(*(getattr(QuestionResponse, column) for column in STATS_COLUMNS))\
+            .where(QuestionResponse.id > watermark.last_id)\
+            .order_by(QuestionResponse.id.asc())\
+            .limit(chunk_size)
+        frame = pd.read_sql(query, db.session.connection())
+        if frame.empty:
+            break
+
+        _merge(_aggregate(frame))
+        watermark.last_id = int(frame['id'].iloc[-1])
+        db.session.commit()
+        processed += len(frame)
+
+    db.session.commit()
+    return processed
+
+
+def reset_question_stats(chunk_size=50000):
+    """Rebuild the aggregates from archived responses so the next update starts from the first live one.
+
+    Archived responses left the live table after they were counted (see
+    app.archive); they are read back from the segment files here, in one
+    transaction with the reset. Returns the number of archived responses.
+    """
+    import pandas as pd
+    from app.archive import iter_archived_responses
+
+    QuestionStats.query.delete()
+    AnalyticsWatermark.query.filter_by(name=JOB_NAME).delete()
+
+    processed = 0
+    chunk = []
+    for response in iter_archived_responses():
+        chunk.append(response)
+        if len(chunk) == chunk_size:
+            _merge(_aggregate(pd.DataFrame.from_records(chunk, columns=STATS_COLUMNS)))
+            processed += len(chunk)
+            chunk = []
+    if chunk:
+        _merge(_aggregate(pd.DataFrame.from_records(chunk, columns=STATS_COLUMNS)))
+        processed += len(chunk)
+
+    db.session.commit()
+    return processed
+
+
+def _aggregate(frame):
+    """Reduce a chunk of responses to per-question totals"""
+    import pandas as pd
+
+    # Compact responses store the answer as a position in the options it was
+    # given from; -1 stands for rows compacted before option sets were kept
+    encoded = frame['answer_index'].notna()
+    if encoded.any():
+        keys = pd.MultiIndex.from_arrays([frame.loc[encoded, 'question_id'],
+                                          frame.loc[encoded, 'option_set_id'].fillna(-1).astype(int),
+                                          frame.loc[encoded, 'answer_index'].astype(int)])
+        answers = {
+            (question_id, set_id, index): decode_answer(
+                option_list(question_bank.get(question_id), None if set_id == -1 else set_id), index, None)
+            for question_id, set_id, index in keys.unique()
+        }
+        frame.loc[encoded, 'user_answer'] = keys.map(answers)
+
+    answered = frame['user_answer'].notna()
+    correct = frame['is_correct'].fillna(False).astype(bool) & answered
+    seconds = frame['time_taken'].fillna(0).clip(0, TIME_BUCKETS - 1).astype(int)
+
+    # Counts per question; skips and timeouts without an answer count as skipped
+    flags = pd.DataFrame({
+        'question_id': frame['question_id'],
+        'answered': answered.astype(int),
+        'skipped': (~answered).astype(int),
+        'correct': correct.astype(int),
+        'time_total': seconds.where(answered, 0),
+    })
+    totals = flags.groupby('question_id').sum()
+    labels = frame.groupby('question_id')[['topic', 'level']].last()
+
+    # Answer time histogram, one column per second
+    histogram = pd.crosstab(frame.loc[answered, 'question_id'], seconds[answered])\
+        .reindex(index=totals.index, columns=range(TIME_BUCKETS), fill_value=0)
+
+    # How often each wrong option was picked
+    wrong = frame[answered & ~correct]
+    distractors = wrong.groupby(['question_id', 'user_answer']).size()
+
+    return totals, labels, histogram, distractors
+
+
+def _merge(aggregates):
+    """Add a chunk's totals to the stored QuestionStats rows"""
+    import pandas as pd
+
+    totals, labels, histogram, distractors = aggregates
+    question_ids = [str(question_id) for question_id in totals.index]
+    existing = {
+        stats.question_id: stats
+        for stats in QuestionStats.query.filter(QuestionStats.question_id.in_(question_ids))
+    }
+
+    for question_id in question_ids:
+        stats = existing.get(question_id)
+        if stats is None:
+            stats = QuestionStats(question_id=question_id, answered=0, skipped=0, correct=0,
+                                  time_total=0, time_histogram='[]', distractor_counts='{}')
+            db.session.add(stats)
+
+        row = totals.loc[question_id]
+        stats.answered += int(row['answered'])
+        stats.skipped += int(row['skipped'])
+        stats.correct += int(row['correct'])
+        stats.time_total += int(row['time_total'])
+
+        topic, level = labels.loc[question_id]
+        if pd.notna(topic):
+            stats.topic = topic
+        if pd.notna(level):
+            stats.level = int(level)
+
+        counts = json.loads(stats.time_histogram) or [0] * TIME_BUCKETS
+        stats.time_histogram = json.dumps([
+            old + int(new) for old, new in zip(counts, histogram.loc[question_id])
+        ])
+
+        if question_id in distractors.index.get_level_values(0):
+            picks = json.loads(stats.distractor_counts)
+            for answer, count in distractors.loc[question_id].items():
+                picks[answer] = picks.get(answer, 0) + int(count)
+            stats.distractor_counts = json.dumps(picks, ensure_ascii=False)
+
+
+def time_percentiles(stats_rows, percentiles=(50, 90)):
+    """Estimate answer time percentiles from the stored histograms.
+
+    Returns one list of whole seconds per row, in the order of `percentiles`,
+    or None for questions nobody has answered yet.
+    """
+    import numpy as np
+
+    if not stats_rows:
+        return []
+    counts = np.array([json.loads(stats.time_histogram) or [0] * TIME_BUCKETS for stats in stats_rows])
+    cumulative = np.cumsum(counts, axis=1)
+    totals = cumulative[:, -1]
+
+    result = []
+    for row, total in zip(cumulative, totals):
+        if not total:
+            result.append(None)
+            continue
+        targets = np.maximum(np.asarray(percentiles) / 100 * total, 1)
+        result.append([int(second) for second in np.searchsorted(row, targets)])
+    return result
+
+
+def distractor_rates(stats):
+    """Return (answer, share of answers) for each wrong option, most picked first"""
+    picks = json.loads(stats.distractor_counts)
+    if not stats.answered:
+        return []
+    return sorted(((answer, count / stats.answered * 100) for answer, count in picks.items()),
+                  key=lambda item: item[1], reverse=True)
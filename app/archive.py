@@ -0,0 +1,241 @@
+# app/archive.py
+from app import db
+from app.models import ArchivedAttempt, ArchiveSummary, QuizAttempt, QuestionResponse, UserStats
+from collections import defaultdict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import DateTime, delete, func, insert, or_, select
+from sqlalchemy.exc import IntegrityError
+import gzip, json, os
+
+# Archived attempts live in gzip'd JSON Lines segments, one per batch, one
+# line per attempt: {"id": <attempt id>, "attempt": {...}, "responses": [...]}
+# with every column of the rows as they were. ArchivedAttempt indexes the
+# segments and ArchiveSummary keeps the counts the dashboard needs.
+
+
+def archive_dir():
+    return current_app.config.get('ARCHIVE_DIR') or os.path.join(current_app.instance_path, 'archive')
+
+
+def archive_attempts(days=None, batch_size=500):
+    """Move unfinished and anonymous attempts older than `days` out of the live tables.
+
+    Each batch of attempts and their responses is written to a segment file,
+    synced, and then deleted in the transaction that records it in
+    ArchivedAttempt and ArchiveSummary. Finished attempts of registered
+    users stay, the leaderboards are rebuilt from them. Returns the number
+    of attempts archived.
+    """
+    from app.analytics import update_question_stats
+    from app.user_stats import get_user_stats
+
+    if days is None:
+        days = current_app.config.get('ARCHIVE_AFTER_DAYS', 30)
+    cutoff = datetime.utcnow() - timedelta(days=days)
+
+    # Question stats are folded in by response id; count every response before it leaves
+    update_question_stats()
+
+    # SQLite gives new rows max(id) + 1, so removing the newest attempt or
+    # response would hand its id out again; those two rows always stay
+    newest_attempt = db.session.query(func.max(QuizAttempt.id)).scalar() or 0
+    newest_response = db.session.query(func.max(QuestionResponse.id)).scalar() or 0
+
+    attempts_table = QuizAttempt.__table__
+    responses_table = QuestionResponse.__table__
+    os.makedirs(archive_dir(), exist_ok=True)
+
+    archived = 0
+    last_id = 0
+    while True:
+        attempts = db.session.execute(
+            select(attempts_table)
+            .where(attempts_table.c.id > last_id,
+                   attempts_table.c.id < newest_attempt,
+                   attempts_table.c.date_attempted < cutoff,
+                   or_(attempts_table.c.user_id.is_(None), attempts_table.c.is_complete.isnot(True)))
+            .order_by(attempts_table.c.id.asc())
+            .limit(batch_size)
+        ).mappings().all()
+        if not attempts:
+            break
+        last_id = attempts[-1]['id']
+
+        responses = defaultdict(list)
+        for row in db.session.execute(
+            select(responses_table)
+            .where(responses_table.c.attempt_id.in_([attempt['id'] for attempt in attempts]))
+            .order_by(responses_table.c.id.asc())
+        ).mappings():
+            responses[row['attempt_id']].append(row)
+
+        records = [
+            {'id': attempt['id'],
+             'attempt': _encode(attempts_table, attempt),
+             'responses': [_encode(responses_table, row) for row in responses[attempt['id']]]}
+            for attempt in attempts
+            if not any(row['id'] == newest_response for row in responses[attempt['id']])
+        ]
+        if not records:
+            continue
+
+        # Users' totals are computed from their attempts the first time; do it while they're here
+        user_ids = {record['attempt']['user_id'] for record in records} - {None}
+        have_stats = {user_id for (user_id,) in
+                      db.session.query(UserStats.user_id).filter(UserStats.user_id.in_(user_ids))}
+        for user_id in user_ids - have_stats:
+            get_user_stats(user_id)
+
+        segment = _write_segment(records)
+        try:
+            ids = [record['id'] for record in records]
+            db.session.execute(insert(ArchivedAttempt), [
+                dict(_decode(ArchivedAttempt.__table__, record['attempt']), segment=segment)
+                for record in records
+            ])
+            _update_summary(records, 1)
+            db.session.execute(delete(QuestionResponse).where(QuestionResponse.attempt_id.in_(ids)))
+            db.session.execute(delete(QuizAttempt).where(QuizAttempt.id.in_(ids)))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            os.remove(os.path.join(archive_dir(), segment))
+            raise
+        archived += len(records)
+
+    return archived
+
+
+def restore_attempt(attempt_id, user_id=None):
+    """Put an archived attempt and its responses back in the live tables.
+
+    With `user_id`, only that user's attempts are restored. Returns the
+    QuizAttempt, or None if it isn't archived (for that user).
+    """
+    archived = db.session.get(ArchivedAttempt, attempt_id)
+    if archived is None or (user_id is not None and archived.user_id != user_id):
+        return None
+    segment = archived.segment
+    record = _read_record(segment, attempt_id)
+    if record is None:
+        return None
+
+    try:
+        db.session.execute(insert(QuizAttempt), [_decode(QuizAttempt.__table__, record['attempt'])])
+        if record['responses']:
+            db.session.execute(insert(QuestionResponse), [
+                _decode(QuestionResponse.__table__, response) for response in record['responses']
+            ])
+        _update_summary([record], -1)
+        db.session.delete(archived)
+        db.session.commit()
+    except IntegrityError:
+        # Another request restored it first
+        db.session.rollback()
+        return db.session.get(QuizAttempt, attempt_id)
+
+    # Segments are never rewritten; drop one once nothing in it is archived any more
+    if not db.session.query(ArchivedAttempt.query.filter_by(segment=segment).exists()).scalar():
+        try:
+            os.remove(os.path.join(archive_dir(), segment))
+        except FileNotFoundError:
+            pass
+    return db.session.get(QuizAttempt, attempt_id)
+
+
+def iter_archived_responses():
+    """Yield the responses of the attempts still archived, as column dicts.
+
+    Segments are read one at a time; attempts restored since are skipped,
+    their responses are back in the live table.
+    """
+    segments = defaultdict(set)
+    for attempt_id, segment in db.session.query(ArchivedAttempt.id, ArchivedAttempt.segment):
+        segments[segment].add(attempt_id)
+
+    for segment, attempt_ids in sorted(segments.items()):
+        try:
+            with gzip.open(os.path.join(archive_dir(), segment), 'rb') as f:
+                for line in f:
+                    record = json.loads(line)
+                    if record['id'] in attempt_ids:
+                        for response in record['responses']:
+                            yield _decode(QuestionResponse.__table__, response)
+        except FileNotFoundError:
+            current_app.logger.warning('Archive segment %s is missing', segment)
+
+
+def _encode(table, row):
+    """JSON-ready copy of a row's columns"""
+    record = {}
+    for column in table.columns:
+        value = row[column.name]
+        record[column.name] = value.isoformat() if isinstance(value, datetime) else value
+    return record
+
+
+def _decode(table, record):
+    """Column values of `table` from an archived record; columns it lacks are left out"""
+    values = {}
+    for column in table.columns:
+        if column.name in record:
+            value = record[column.name]
+            if value is not None and isinstance(column.type, DateTime):
+                value = datetime.fromisoformat(value)
+            values[column.name] = value
+    return values
+
+
+def _write_segment(records):
+    """Write a batch to a new segment file, synced to disk, and return its name"""
+    name = 'attempts-{}-{}-{}.jsonl.gz'.format(
+        datetime.utcnow().strftime('%Y%m%d-%H%M%S'), records[0]['id'], records[-1]['id'])
+    path = os.path.join(archive_dir(), name)
+    with open(path + '.tmp', 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8') + b'\n')
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(path + '.tmp', path)
+    return name
+
+
+def _read_record(segment, attempt_id):
+    """Find an attempt's line in a segment, or None if the segment is gone"""
+    prefix = f'{{"id":{attempt_id},'.encode()
+    try:
+        with gzip.open(os.path.join(archive_dir(), segment), 'rb') as f:
+            for line in f:
+                if line.startswith(prefix):
+                    return json.loads(line)
+    except FileNotFoundError:
+        current_app.logger.warning('Archive segment %s is missing', segment)
+    return None
+
+
+def _update_summary(records, sign):
+    """Add (sign 1) or remove (sign -1) archived attempts from ArchiveSummary"""
+    totals = defaultdict(lambda: defaultdict(int))
+    for record in records:
+        attempt = record['attempt']
+        attempted = datetime.fromisoformat(attempt['date_attempted']) if attempt['date_attempted'] else datetime.utcnow()
+        counts = totals[(attempted.date(), attempt['quiz_id'],
+                         attempt['level_reached'] or 0, bool(attempt['is_complete']))]
+        counts['attempts'] += 1
+        counts['anonymous'] += attempt['user_id'] is None
+        counts['responses'] += len(record['responses'])
+        counts['correct'] += sum(1 for response in record['responses'] if response['is_correct'])
+        counts['score'] += attempt['score'] or 0
+
+    for key, counts in totals.items():
+        summary = db.session.get(ArchiveSummary, key)
+        if summary is None:
+            day, quiz_id, level_reached, is_complete = key
+            summary = ArchiveSummary(day=day, quiz_id=quiz_id, level_reached=level_reached,
+                                     is_complete=is_complete, attempts=0, anonymous=0,
+                                     responses=0, correct=0, score=0)
+            db.session.add(summary)
+        for field, value in counts.items():
+            setattr(summary, field, getattr(summary, field) + sign * value)
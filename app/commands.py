@@ -0,0 +1,188 @@
+# app/commands.py
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+db_cli = AppGroup('db', help='Database maintenance commands.')
+questions_cli = AppGroup('questions', help='Question bank commands.')
+leaderboard_cli = AppGroup('leaderboard', help='Leaderboard commands.')
+analytics_cli = AppGroup('analytics', help='Question analytics commands.')
+export_cli = AppGroup('export', help='Data export commands.')
+
+
+@db_cli.command('upgrade')
+def upgrade_command():
+    """Create missing tables, columns and indexes."""
+    from app.migrations import upgrade_schema
+    upgrade_schema()
+    click.echo('Database schema is up to date.')
+
+
+@db_cli.command('backfill-responses')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Rows to update per transaction.')
+def backfill_responses_command(batch_size):
+    """Fill in level/topic/points on older question responses."""
+    from app.migrations import backfill_responses
+    updated = backfill_responses(batch_size=batch_size)
+    click.echo(f'Backfilled {updated} question responses.')
+
+
+@db_cli.command('compact-responses')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Rows to update per transaction.')
+@click.option('--vacuum', is_flag=True, help='Rebuild the SQLite file afterwards to reclaim the space.')
+def compact_responses_command(batch_size, vacuum):
+    """Store older responses' options and answers as option positions."""
+    from app.migrations import compact_responses, vacuum as vacuum_database
+    compacted = compact_responses(batch_size=batch_size)
+    click.echo(f'Compacted {compacted} question responses.')
+    if vacuum:
+        if vacuum_database():
+            click.echo('Database file rebuilt.')
+        else:
+            click.echo('--vacuum only applies to SQLite; skipped.')
+
+
+@db_cli.command('flush-responses')
+@click.option('--idle', type=float,
+              help='Only quizzes without activity for this many seconds [default: RESPONSE_FLUSH_INTERVAL].')
+def flush_responses_command(idle):
+    """Write answers still buffered in idle quiz sessions (write-behind mode)."""
+    from app import quiz_sessions
+    if idle is None:
+        idle = current_app.config.get('RESPONSE_FLUSH_INTERVAL', 120)
+    flushed = quiz_sessions.sweep(idle)
+    click.echo(f'Flushed the buffered responses of {flushed} quiz sessions.')
+
+
+@db_cli.command('archive-attempts')
+@click.option('--days', type=click.IntRange(min=1),
+              help='Archive attempts older than this many days [default: ARCHIVE_AFTER_DAYS].')
+@click.option('--batch-size', default=500, show_default=True,
+              help='Attempts per segment file and transaction.')
+def archive_attempts_command(days, batch_size):
+    """Move old unfinished and anonymous attempts to compressed archive files."""
+    from app.archive import archive_attempts
+    archived = archive_attempts(days=days, batch_size=batch_size)
+    click.echo(f'Archived {archived} quiz attempts.')
+
+
+@db_cli.command('restore-attempt')
+@click.argument('attempt_id', type=int)
+def restore_attempt_command(attempt_id):
+    """Bring an archived attempt back into the live tables."""
+    from app.archive import restore_attempt
+    if restore_attempt(attempt_id) is None:
+        raise click.ClickException(f'Attempt {attempt_id} is not in the archive.')
+    click.echo(f'Restored attempt {attempt_id}.')
+
+
+def _check_questions(path):
+    """Validate a question file, printing every problem found"""
+    from app.question_import import iter_questions, validate_questions
+    try:
+        count, errors = validate_questions(iter_questions(path))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for error in errors:
+        click.echo(error, err=True)
+    return count, errors
+
+
+@questions_cli.command('validate')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False), default='questions.json')
+def validate_questions_command(path):
+    """Check a questions.json or .jsonl file without importing it."""
+    count, errors = _check_questions(path)
+    if errors:
+        raise click.ClickException(f'{len(errors)} problems in {count} questions.')
+    click.echo(f'{count} questions are valid.')
+
+
+@questions_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False), default='questions.json')
+@click.option('--store', type=click.Choice(['json', 'database']),
+              help='Where to import to. Defaults to QUESTION_BANK_SOURCE.')
+@click.option('--prune', is_flag=True, help='Delete database questions that are not in the file.')
+@click.option('--batch-size', default=1000, show_default=True, help='Questions to compare and write per batch.')
+def import_questions_command(path, store, prune, batch_size):
+    """Validate a questions.json or .jsonl file and load the changed questions."""
+    from app import page_cache, question_bank
+    from app.question_import import iter_questions
+
+    # Nothing is written unless the whole file is valid
+    count, errors = _check_questions(path)
+    if errors:
+        raise click.ClickException(f'{len(errors)} problems in {count} questions; nothing was imported.')
+
+    if (store or current_app.config.get('QUESTION_BANK_SOURCE', 'json')) == 'database':
+        from app.question_store import import_questions
+        counts = import_questions(iter_questions(path), prune=prune, batch_size=batch_size)
+    else:
+        # The JSON store is the questions file itself, so it is replaced as a whole
+        from app.question_import import import_to_file
+        counts = import_to_file(path, question_bank.path)
+    page_cache.clear()
+    click.echo('Imported questions: {created} created, {updated} updated, {deleted} deleted.'.format(**counts))
+
+
+@questions_cli.command('export')
+@click.argument('path', type=click.Path(dir_okay=False), default='-')
+def export_questions_command(path):
+    """Write the database questions in questions.json format."""
+    from app.question_import import write_questions
+    from app.question_store import export_questions
+    with click.open_file(path, 'w', encoding='utf-8') as f:
+        write_questions(export_questions(), f)
+
+
+@leaderboard_cli.command('rebuild')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Attempts to read and entries to insert per batch.')
+def rebuild_leaderboard_command(batch_size):
+    """Recreate the leaderboards from finished attempts."""
+    from app.leaderboard import rebuild
+    written = rebuild(batch_size=batch_size)
+    click.echo(f'Rebuilt leaderboards with {written} entries.')
+
+
+@analytics_cli.command('update')
+@click.option('--chunk-size', default=50000, show_default=True,
+              help='Responses to aggregate per transaction.')
+@click.option('--full', is_flag=True,
+              help='Rebuild the aggregates from the archived responses and the first live response on.')
+def update_analytics_command(chunk_size, full):
+    """Aggregate new question responses into per-question stats."""
+    from app.analytics import reset_question_stats, update_question_stats
+    if full:
+        archived = reset_question_stats(chunk_size=chunk_size)
+        click.echo(f'Aggregated {archived} archived question responses.')
+    processed = update_question_stats(chunk_size=chunk_size)
+    click.echo(f'Aggregated {processed} new question responses.')
+
+
+@export_cli.command('attempts')
+@click.argument('path', type=click.Path(dir_okay=False), default='-')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default='csv', show_default=True)
+@click.option('--topic', help='Only attempts of this topic.')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), help='First day to include.')
+@click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), help='Last day to include.')
+@click.option('--username', help='Only attempts of this user.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows to fetch per round trip.')
+def export_attempts_command(path, fmt, topic, since, until, username, batch_size):
+    """Stream attempts and their responses as CSV or JSONL."""
+    from app.export import export_chunks
+    with click.open_file(path, 'w', encoding='utf-8') as f:
+        for chunk in export_chunks(fmt, topic=topic, username=username, batch_size=batch_size,
+                                   since=since.date() if since else None,
+                                   until=until.date() if until else None):
+            f.write(chunk)
+
+
+def register_commands(app):
+    app.cli.add_command(db_cli)
+    app.cli.add_command(questions_cli)
+    app.cli.add_command(leaderboard_cli)
+    app.cli.add_command(analytics_cli)
+    app.cli.add_command(export_cli)
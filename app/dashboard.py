@@ -0,0 +1,112 @@
+# app/dashboard.py
+from flask import current_app
+from app import db
+from app.models import User, Quiz, QuizAttempt, ArchiveSummary
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import case, func
+import threading, time
+
+# Aggregates are cheap but not free; share them between admin page views
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cached(key, compute):
+    ttl = current_app.config.get('ADMIN_STATS_TTL', 60)
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit and now - hit[0] < ttl:
+            return hit[1]
+    value = compute()
+    with _cache_lock:
+        _cache[key] = (now, value)
+    return value
+
+
+def _window_start(days):
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=days - 1)
+
+
+def dashboard_stats(days=30, topic=None):
+    """Aggregate attempt statistics for the last `days` days.
+
+    Every figure comes from a GROUP BY over the date_attempted index, so
+    the cost depends on the window, not on the size of the attempts table.
+    """
+    return _cached(('dashboard', days, topic), lambda: _compute_stats(days, topic))
+
+
+def _compute_stats(days, topic):
+    since = _window_start(days)
+    window = QuizAttempt.query.filter(QuizAttempt.date_attempted >= since)
+    if topic:
+        window = window.join(QuizAttempt.quiz).filter(Quiz.topic == topic)
+    attempts = window.subquery()
+
+    totals = db.session.query(
+        func.count(attempts.c.id),
+        func.coalesce(func.sum(case((attempts.c.is_complete, 1), else_=0)), 0),
+        func.count(func.distinct(attempts.c.user_id))
+    ).one()
+
+    per_topic = db.session.query(Quiz.topic, func.count(attempts.c.id))\
+        .join(attempts, attempts.c.quiz_id == Quiz.id)\
+        .group_by(Quiz.topic).order_by(func.count(attempts.c.id).desc()).all()
+
+    day = func.date(attempts.c.date_attempted)
+    per_day = db.session.query(day, func.count(attempts.c.id))\
+        .group_by(day).order_by(day.asc()).all()
+
+    # Finished attempts by the level they reached; 5 means all levels cleared
+    reached = Counter(dict(db.session.query(attempts.c.level_reached, func.count(attempts.c.id))
+                           .filter(attempts.c.is_complete)
+                           .group_by(attempts.c.level_reached).all()))
+    
+    # Archived attempts (app.archive) only remain as daily counts; add them in.
+    # They can't be told apart by user, so active_users counts live attempts only.
+    archived = db.session.query(ArchiveSummary.day, Quiz.topic, ArchiveSummary.level_reached,
+                                ArchiveSummary.is_complete, func.sum(ArchiveSummary.attempts))\
+        .join(Quiz, Quiz.id == ArchiveSummary.quiz_id)\
+        .filter(ArchiveSummary.day >= since.date())
+    if topic:
+        archived = archived.filter(Quiz.topic == topic)
+    archived = archived.group_by(ArchiveSummary.day, Quiz.topic, ArchiveSummary.level_reached,
+                                 ArchiveSummary.is_complete).all()
+    
+    total_attempts, completed_attempts = totals[0], totals[1]
+    topic_counts, day_counts = Counter(dict(per_topic)), Counter({str(d): count for d, count in per_day})
+    for archived_day, archived_topic, level_reached, is_complete, count in archived:
+        if not count:
+            continue
+        total_attempts += count
+        topic_counts[archived_topic] += count
+        day_counts[str(archived_day)] += count
+        if is_complete:
+            completed_attempts += count
+            reached[level_reached] += count
+    
+    pass_rates = []
+    for level in range(1, 5):
+        tried = sum(count for reached_level, count in reached.items() if reached_level >= level)
+        passed = sum(count for reached_level, count in reached.items() if reached_level > level)
+        pass_rates.append({
+            'level': level,
+            'attempted': tried,
+            'passed': passed,
+            'rate': (passed / tried) * 100 if tried else 0
+        })
+
+    return {
+        'days': days,
+        'since': since,
+        'total_attempts': total_attempts,
+        'completed_attempts': completed_attempts,
+        'active_users': totals[2],
+        'total_users': db.session.query(func.count(User.id)).scalar(),
+        'per_topic': topic_counts.most_common(),
+        'per_day': sorted(day_counts.items()),
+        'pass_rates': pass_rates
+    }
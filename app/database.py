@@ -0,0 +1,51 @@
+# app/database.py
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Applied to every new SQLite connection. WAL lets readers run alongside the
+# single writer, NORMAL sync is durable across app crashes in WAL mode, and
+# the busy timeout makes writers wait for the lock instead of failing.
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,         # Milliseconds
+    'mmap_size': 268435456,       # 256 MB of memory-mapped I/O
+    'cache_size': -20000,         # 20 MB page cache
+    'temp_store': 'MEMORY',
+}
+
+
+def engine_options(config):
+    """Build SQLALCHEMY_ENGINE_OPTIONS for the configured database"""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        options = {
+            # Seconds pysqlite waits for a lock before raising "database is locked"
+            'connect_args': {'timeout': config.get('SQLITE_BUSY_TIMEOUT', 5.0), 'check_same_thread': False},
+        }
+        # In-memory databases live in a single shared connection (StaticPool), which takes no sizes
+        if url.database not in (None, '', ':memory:') and url.query.get('mode') != 'memory':
+            options['pool_size'] = config.get('DATABASE_POOL_SIZE', 10)
+            options['max_overflow'] = config.get('DATABASE_MAX_OVERFLOW', 20)
+        return options
+
+    # Server databases (e.g. mysql+pymysql://...) get a pre-pinged, recycled pool
+    return {
+        'pool_size': config.get('DATABASE_POOL_SIZE', 10),
+        'max_overflow': config.get('DATABASE_MAX_OVERFLOW', 20),
+        'pool_recycle': config.get('DATABASE_POOL_RECYCLE', 280),
+        'pool_pre_ping': True,
+    }
+
+
+def configure_engine(engine, pragmas):
+    """Apply SQLite pragmas to each new connection of `engine`"""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
@@ -0,0 +1,110 @@
+# app/export.py
+from app import db, question_bank
+from app.models import User, Quiz, QuizAttempt, QuestionResponse
+from app.response_codec import decode_answer, option_list
+from datetime import datetime, time, timedelta
+from sqlalchemy import select
+import csv, io, json
+
+EXPORT_COLUMNS = [
+    'attempt_id', 'username', 'topic', 'date_attempted', 'level_reached', 'attempt_score',
+    'is_complete', 'response_id', 'question_id', 'level', 'user_answer', 'is_correct',
+    'time_taken', 'points', 'possible_points',
+]
+
+QUESTION_ID = EXPORT_COLUMNS.index('question_id')
+USER_ANSWER = EXPORT_COLUMNS.index('user_answer')
+
+# Rows are encoded into chunks of about this many characters before being yielded
+CHUNK_SIZE = 64 * 1024
+
+
+def export_rows(topic=None, since=None, until=None, username=None, batch_size=1000):
+    """Yield one tuple per question response (in EXPORT_COLUMNS order).
+
+    Attempts without responses yield a single row with the response columns
+    empty. `since` and `until` are dates, both inclusive. Rows are fetched
+    `batch_size` at a time through a streaming cursor, so memory use does
+    not depend on how many rows match.
+    """
+    query = select(
+        QuizAttempt.id, User.username, Quiz.topic, QuizAttempt.date_attempted,
+        QuizAttempt.level_reached, QuizAttempt.score, QuizAttempt.is_complete,
+        QuestionResponse.id, QuestionResponse.question_id, QuestionResponse.level,
+        QuestionResponse.user_answer, QuestionResponse.is_correct, QuestionResponse.time_taken,
+        QuestionResponse.points, QuestionResponse.possible_points, QuestionResponse.option_set_id,
+        QuestionResponse.answer_index
+    ).join(Quiz, Quiz.id == QuizAttempt.quiz_id)\
+        .outerjoin(User, User.id == QuizAttempt.user_id)\
+        .outerjoin(QuestionResponse, QuestionResponse.attempt_id == QuizAttempt.id)
+
+    if topic:
+        query = query.where(Quiz.topic == topic)
+    if since:
+        query = query.where(QuizAttempt.date_attempted >= datetime.combine(since, time.min))
+    if until:
+        query = query.where(QuizAttempt.date_attempted < datetime.combine(until + timedelta(days=1), time.min))
+    if username:
+        query = query.where(User.username == username)
+
+    query = query.order_by(QuizAttempt.id.asc(), QuestionResponse.id.asc())
+    result = db.session.execute(query.execution_options(yield_per=batch_size))
+    answers = {}
+    for partition in result.partitions():
+        for row in partition:
+            *row, option_set_id, index = row
+            if index is not None:
+                # Compact responses store the answer as a position in the options it was given from
+                key = (row[QUESTION_ID], option_set_id, index)
+                if key not in answers:
+                    answers[key] = decode_answer(option_list(question_bank.get(key[0]), option_set_id),
+                                                 index, None)
+                row[USER_ANSWER] = answers[key]
+            yield tuple(row)
+
+
+def _chunked(lines):
+    """Join encoded lines into CHUNK_SIZE pieces to keep the write count low"""
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _csv_lines(rows):
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow(row)
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+    # Header only, when nothing matched
+    yield output.getvalue()
+
+
+def _jsonl_lines(rows):
+    for row in rows:
+        record = dict(zip(EXPORT_COLUMNS, row))
+        if record['date_attempted'] is not None:
+            record['date_attempted'] = record['date_attempted'].isoformat()
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+# format name -> (encoder, mimetype, file extension)
+FORMATS = {
+    'csv': (_csv_lines, 'text/csv', 'csv'),
+    'jsonl': (_jsonl_lines, 'application/x-ndjson', 'jsonl'),
+}
+
+
+def export_chunks(fmt, **filters):
+    """Yield the encoded export in FORMATS[fmt] as text chunks"""
+    encode = FORMATS[fmt][0]
+    return _chunked(encode(export_rows(**filters)))
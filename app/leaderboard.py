@@ -0,0 +1,148 @@
+# app/leaderboard.py
+from flask import current_app
+from app import db
+from app.models import LeaderboardEntry, Quiz, QuizAttempt
+from datetime import date, datetime, timedelta
+from sqlalchemy.orm import joinedload
+import threading, time
+
+PERIODS = ('daily', 'weekly', 'all')
+ALL_TIME_START = date(1970, 1, 1)
+
+# Top-N lists per (topic, period, period_start), shared by requests in this process
+_top_cache = {}
+_top_cache_lock = threading.Lock()
+
+
+def period_start(period, when):
+    """Return the first day of the period containing `when`"""
+    day = when.date() if isinstance(when, datetime) else when
+    if period == 'daily':
+        return day
+    if period == 'weekly':
+        return day - timedelta(days=day.weekday())
+    return ALL_TIME_START
+
+
+def record_finished_attempt(attempt, topic):
+    """Fold a finished attempt into the topic's daily, weekly and all-time boards.
+
+    Call before committing the attempt. The attempt counts towards the
+    periods it was started in, as it does in rebuild(). Only the player's
+    existing rows for those periods are read, so the cost does not grow
+    with the size of the board.
+    """
+    if attempt.user_id is None:
+        return
+
+    attempted_at = attempt.date_attempted
+    starts = {period: period_start(period, attempted_at) for period in PERIODS}
+    existing = {
+        entry.period: entry
+        for entry in LeaderboardEntry.query.filter(
+            LeaderboardEntry.topic == topic,
+            LeaderboardEntry.user_id == attempt.user_id,
+            db.tuple_(LeaderboardEntry.period, LeaderboardEntry.period_start).in_(list(starts.items()))
+        )
+    }
+
+    for period, start in starts.items():
+        entry = existing.get(period)
+        if entry is None:
+            db.session.add(LeaderboardEntry(topic=topic, period=period, period_start=start,
+                                            user_id=attempt.user_id, best_score=attempt.score,
+                                            achieved_at=attempted_at))
+        elif attempt.score > entry.best_score:
+            entry.best_score = attempt.score
+            entry.achieved_at = attempted_at
+        else:
+            continue
+        _invalidate(topic, period, start)
+
+
+def top_entries(topic, period, limit=None):
+    """Return the top entries of the current period, best first"""
+    limit = limit or current_app.config.get('LEADERBOARD_SIZE', 10)
+    start = period_start(period, datetime.utcnow())
+    key = (topic, period, start)
+    ttl = current_app.config.get('LEADERBOARD_CACHE_TTL', 30)
+
+    with _top_cache_lock:
+        hit = _top_cache.get(key)
+        if hit and time.monotonic() - hit[0] < ttl and hit[1] >= limit:
+            return hit[2][:limit]
+
+    entries = LeaderboardEntry.query.options(joinedload(LeaderboardEntry.user))\
+        .filter_by(topic=topic, period=period, period_start=start)\
+        .order_by(LeaderboardEntry.best_score.desc(), LeaderboardEntry.achieved_at.asc())\
+        .limit(limit).all()
+    # Detach plain values so cached rows don't hold on to a session
+    rows = [{'user_id': e.user_id, 'username': e.user.username, 'score': e.best_score,
+             'achieved_at': e.achieved_at} for e in entries]
+
+    with _top_cache_lock:
+        _top_cache[key] = (time.monotonic(), limit, rows)
+    return rows
+
+
+def user_rank(topic, period, user_id):
+    """Return (rank, best_score) for a user in the current period, or None"""
+    start = period_start(period, datetime.utcnow())
+    entry = LeaderboardEntry.query.filter_by(topic=topic, period=period, period_start=start,
+                                             user_id=user_id).first()
+    if entry is None:
+        return None
+
+    # An index range count over the (topic, period, period_start, best_score) index
+    higher = LeaderboardEntry.query.filter(
+        LeaderboardEntry.topic == topic,
+        LeaderboardEntry.period == period,
+        LeaderboardEntry.period_start == start,
+        LeaderboardEntry.best_score > entry.best_score
+    ).count()
+    return higher + 1, entry.best_score
+
+
+def _invalidate(topic, period, start):
+    with _top_cache_lock:
+        _top_cache.pop((topic, period, start), None)
+
+
+def rebuild(batch_size=1000):
+    """Recreate every board from finished attempts.
+
+    The all-time board covers all history; daily and weekly boards are
+    rebuilt for the last LEADERBOARD_RETENTION_DAYS days only. Returns the
+    number of entries written.
+    """
+    retention = current_app.config.get('LEADERBOARD_RETENTION_DAYS', 56)
+    cutoff = (datetime.utcnow() - timedelta(days=retention)).date()
+
+    best = {}
+    attempts = db.session.query(QuizAttempt.user_id, QuizAttempt.score, QuizAttempt.date_attempted, Quiz.topic)\
+        .join(Quiz, Quiz.id == QuizAttempt.quiz_id)\
+        .filter(QuizAttempt.is_complete.is_(True), QuizAttempt.user_id.isnot(None))\
+        .order_by(QuizAttempt.id.asc())\
+        .yield_per(batch_size)
+    for user_id, score, attempted_at, topic in attempts:
+        for period in PERIODS:
+            start = period_start(period, attempted_at)
+            if period != 'all' and start < cutoff:
+                continue
+            key = (topic, period, start, user_id)
+            if key not in best or score > best[key][0]:
+                best[key] = (score, attempted_at)
+
+    LeaderboardEntry.query.delete()
+    rows = [
+        {'topic': topic, 'period': period, 'period_start': start, 'user_id': user_id,
+         'best_score': score, 'achieved_at': achieved_at}
+        for (topic, period, start, user_id), (score, achieved_at) in best.items()
+    ]
+    for i in range(0, len(rows), batch_size):
+        db.session.execute(db.insert(LeaderboardEntry), rows[i:i + batch_size])
+    db.session.commit()
+
+    with _top_cache_lock:
+        _top_cache.clear()
+    return len(rows)
@@ -0,0 +1,212 @@
+# app/metrics.py
+from collections import defaultdict
+from flask import Response, abort, before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+import cProfile, os, random, threading, time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout, one series per label set"""
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def means(self):
+        return {labels: total / count for labels, (_, total, count) in self._series.items()}
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total:.6f}')
+            lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return lines
+
+
+class Metrics:
+    """Opt-in per-request instrumentation, exposed at /metrics in Prometheus text format.
+
+    With ``METRICS_ENABLED`` every request records its latency, the number
+    and total time of its SQL statements and the time spent rendering
+    templates, per endpoint; question bank loads are reported too. Numbers
+    are kept per process. ``METRICS_TOKEN`` makes /metrics require that
+    bearer token. ``PROFILE_SAMPLE_RATE`` (0 to 1) runs cProfile on that
+    share of requests, one at a time, and writes the stats to
+    ``PROFILE_DIR`` for `python -m pstats` or snakeviz.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.token = None
+        self.profile_rate = 0.0
+        self.profile_dir = None
+        self._lock = threading.Lock()
+        self._profile_lock = threading.Lock()
+        self._reset()
+        if app is not None:
+            self.init_app(app)
+
+    def _reset(self):
+        self._requests = defaultdict(int)
+        self._latency = Histogram('quiz_request_duration_seconds',
+                                  'Time to build the response', LATENCY_BUCKETS)
+        self._sql_count = Histogram('quiz_request_sql_statements',
+                                    'SQL statements per request', STATEMENT_BUCKETS)
+        self._sql_time = Histogram('quiz_request_sql_duration_seconds',
+                                   'Time spent in SQL per request', LATENCY_BUCKETS)
+        self._template_time = Histogram('quiz_request_template_duration_seconds',
+                                        'Time spent rendering templates per request', LATENCY_BUCKETS)
+
+    def reset(self):
+        with self._lock:
+            self._reset()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', False)
+        app.extensions['metrics'] = self
+        if not self.enabled:
+            return
+
+        self.token = app.config.get('METRICS_TOKEN')
+        self.profile_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+        self.profile_dir = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+        self.reset()
+
+        app.before_request(self._start_request)
+        app.after_request(self._note_status)
+        app.teardown_request(self._finish_request)
+        before_render_template.connect(self._start_template, app, weak=False)
+        template_rendered.connect(self._finish_template, app, weak=False)
+        app.add_url_rule('/metrics', 'metrics', self.render_view)
+
+        from app import db
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._start_statement)
+            event.listen(db.engine, 'after_cursor_execute', self._finish_statement)
+            event.listen(db.engine, 'handle_error', self._fail_statement)
+
+    # Request lifecycle
+
+    def _start_request(self):
+        g._metrics = {'start': time.perf_counter(), 'status': 500,
+                      'sql_count': 0, 'sql_seconds': 0.0, 'template_seconds': 0.0}
+        if self.profile_rate and random.random() < self.profile_rate and self._profile_lock.acquire(blocking=False):
+            # cProfile can only follow one request at a time
+            g._profiler = cProfile.Profile()
+            g._profiler.enable()
+
+    def _note_status(self, response):
+        if '_metrics' in g:
+            g._metrics['status'] = response.status_code
+        return response
+
+    def _finish_request(self, exc):
+        stats = g.pop('_metrics', None)
+        if stats is None:
+            return
+        elapsed = time.perf_counter() - stats['start']
+        endpoint = request.endpoint or 'unmatched'
+
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            try:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                name = f'{endpoint}-{time.strftime("%Y%m%d-%H%M%S")}-{elapsed * 1000:.0f}ms-{os.getpid()}.prof'
+                profiler.dump_stats(os.path.join(self.profile_dir, name))
+            finally:
+                self._profile_lock.release()
+
+        labels = (('endpoint', endpoint),)
+        with self._lock:
+            self._requests[(endpoint, request.method, stats['status'])] += 1
+            self._latency.observe(labels + (('method', request.method),), elapsed)
+            self._sql_count.observe(labels, stats['sql_count'])
+            self._sql_time.observe(labels, stats['sql_seconds'])
+            self._template_time.observe(labels, stats['template_seconds'])
+
+    # SQLAlchemy and template hooks, counted against the current request
+
+    def _start_statement(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+    def _finish_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self._count_statement(conn)
+
+    def _fail_statement(self, context):
+        # Failed statements never reach after_cursor_execute; take their start off the stack here
+        conn = context.connection
+        if conn is not None and context.execution_context is not None and conn.info.get('metrics_start'):
+            self._count_statement(conn)
+
+    def _count_statement(self, conn):
+        started = conn.info['metrics_start'].pop()
+        if has_request_context() and '_metrics' in g:
+            g._metrics['sql_count'] += 1
+            g._metrics['sql_seconds'] += time.perf_counter() - started
+
+    def _start_template(self, app, template, context, **extra):
+        if '_metrics' in g:
+            g._metrics['template_start'] = time.perf_counter()
+
+    def _finish_template(self, app, template, context, **extra):
+        if '_metrics' in g and 'template_start' in g._metrics:
+            g._metrics['template_seconds'] += time.perf_counter() - g._metrics.pop('template_start')
+
+    # Exposition
+
+    def render(self):
+        from app import question_bank
+        lines = ['# HELP quiz_requests_total Requests served',
+                 '# TYPE quiz_requests_total counter']
+        with self._lock:
+            for (endpoint, method, status), count in sorted(self._requests.items()):
+                lines.append(f'quiz_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+            for histogram in (self._latency, self._sql_count, self._sql_time, self._template_time):
+                lines.extend(histogram.render())
+
+        lines += [
+            '# HELP quiz_question_bank_loads_total Question bank (re)loads in this process',
+            '# TYPE quiz_question_bank_loads_total counter',
+            f'quiz_question_bank_loads_total {question_bank.loads}',
+            '# HELP quiz_question_bank_load_seconds_total Time spent reading and indexing the question bank',
+            '# TYPE quiz_question_bank_load_seconds_total counter',
+            f'quiz_question_bank_load_seconds_total {question_bank.load_seconds:.6f}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Per-endpoint means of SQL statements, SQL time and template time (ms), for benchmarks"""
+        result = {}
+        with self._lock:
+            for key, histogram, scale in (('sql_statements', self._sql_count, 1),
+                                          ('sql_ms', self._sql_time, 1000),
+                                          ('template_ms', self._template_time, 1000)):
+                for labels, mean in histogram.means().items():
+                    result.setdefault(dict(labels)['endpoint'], {})[key] = round(mean * scale, 2)
+        return result
+
+    def render_view(self):
+        if self.token and request.headers.get('Authorization') != f'Bearer {self.token}':
+            abort(401)
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,183 @@
+# app/migrations.py
+from app import db, question_bank
+from sqlalchemy import inspect, or_, text, update
+from sqlalchemy.schema import CreateColumn
+import json
+
+
+def upgrade_schema():
+    """Bring the database schema up to date with the models.
+
+    Creates missing tables, then adds any columns and indexes that were
+    added to existing models since the table was created, and fills in the
+    ones reports depend on. New columns must be nullable (or have a server
+    default) for this to work on SQLite.
+    """
+    db.create_all()
+
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        # Quiz.topic became unique; fold duplicate quizzes before indexing it
+        if 'ix_quiz_topic' not in {i['name'] for i in inspector.get_indexes('quiz')}:
+            _merge_duplicate_quizzes(conn)
+        # Responses became unique per attempt and question; drop repeats first
+        if 'ix_question_response_attempt_question' not in \
+                {i['name'] for i in inspector.get_indexes('question_response')}:
+            _drop_duplicate_responses(conn)
+        
+        for table in db.metadata.sorted_tables:
+            existing_columns = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {ddl}'))
+
+            existing_indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn)
+
+    # Responses refer to their question's option list and seen bitmaps to its
+    # slot; hand them out up front rather than in the first requests
+    question_bank.record_option_sets()
+    question_bank.record_question_slots()
+
+    # Reports only read responses with a level; give older rows theirs now
+    # rather than hiding them until someone runs `db backfill-responses`
+    backfill_responses()
+
+
+def _merge_duplicate_quizzes(conn):
+    """Point attempts at the oldest quiz of each topic and drop the others"""
+    duplicates = conn.execute(text(
+        'SELECT topic, MIN(id) FROM quiz GROUP BY topic HAVING COUNT(*) > 1'
+    )).all()
+    for topic, keep_id in duplicates:
+        params = {'topic': topic, 'keep_id': keep_id}
+        conn.execute(text(
+            'UPDATE quiz_attempt SET quiz_id = :keep_id WHERE quiz_id IN '
+            '(SELECT id FROM quiz WHERE topic = :topic AND id != :keep_id)'
+        ), params)
+        conn.execute(text('DELETE FROM quiz WHERE topic = :topic AND id != :keep_id'), params)
+
+
+def _drop_duplicate_responses(conn):
+    """Keep the first response to each question of an attempt and recount the affected scores"""
+    duplicates = conn.execute(text(
+        'SELECT attempt_id, question_id, MIN(id) FROM question_response '
+        'GROUP BY attempt_id, question_id HAVING COUNT(*) > 1'
+    )).all()
+    for attempt_id, question_id, keep_id in duplicates:
+        conn.execute(text(
+            'DELETE FROM question_response WHERE attempt_id = :attempt_id AND question_id = :question_id '
+            'AND id != :keep_id'
+        ), {'attempt_id': attempt_id, 'question_id': question_id, 'keep_id': keep_id})
+    for attempt_id in {attempt_id for attempt_id, _, _ in duplicates}:
+        conn.execute(text(
+            'UPDATE quiz_attempt SET score = (SELECT COALESCE(SUM(points), 0) FROM question_response '
+            'WHERE attempt_id = :attempt_id) WHERE id = :attempt_id'
+        ), {'attempt_id': attempt_id})
+
+
+def backfill_responses(batch_size=1000):
+    """Fill in level, topic and possible_points on older QuestionResponse rows.
+
+    Rows are processed in primary key order, one batch per transaction.
+    Returns the number of rows updated.
+    """
+    from app.models import QuestionResponse
+
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(QuestionResponse.id, QuestionResponse.question_id)\
+            .filter(QuestionResponse.id > last_id, QuestionResponse.level.is_(None))\
+            .order_by(QuestionResponse.id.asc())\
+            .limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        changes = []
+        for row in rows:
+            question = question_bank.get(row.question_id)
+            if question:
+                changes.append({
+                    'id': row.id,
+                    'level': question['level'],
+                    'topic': question['topic'],
+                    'possible_points': question['points']
+                })
+
+        if changes:
+            db.session.execute(update(QuestionResponse), changes)
+        db.session.commit()
+        updated += len(changes)
+
+    return updated
+
+
+def compact_responses(batch_size=1000):
+    """Replace the option and answer text of older QuestionResponse rows with positions.
+
+    Rows are processed in primary key order, one batch per transaction; see
+    app.response_codec for the encoding. Positions are taken in the option
+    set the question has now, so text that doesn't match its current
+    options is kept as it is. Rows compacted before option sets were kept
+    are pinned to the current set too, which is what they decode against
+    until then. Returns the number of rows compacted.
+    """
+    from app.models import QuestionResponse
+    from app.response_codec import answer_index, pack_options
+
+    compacted = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(QuestionResponse.id, QuestionResponse.question_id, QuestionResponse.option_set_id,
+                                QuestionResponse.presented_options, QuestionResponse.user_answer)\
+            .filter(QuestionResponse.id > last_id,
+                    or_(QuestionResponse.presented_options.isnot(None), QuestionResponse.user_answer.isnot(None),
+                        QuestionResponse.option_set_id.is_(None)))\
+            .order_by(QuestionResponse.id.asc())\
+            .limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        changes = []
+        for row in rows:
+            question = question_bank.get(row.question_id)
+            option_set_id = question_bank.option_set_id(row.question_id, record=True) if question else None
+            if option_set_id is None or row.option_set_id not in (None, option_set_id):
+                # The row's positions are in an older set; its remaining text stays
+                continue
+
+            change = {'id': row.id}
+            try:
+                options = json.loads(row.presented_options) if row.presented_options else None
+            except ValueError:
+                options = None
+            option_order = pack_options(question['options'], options) if isinstance(options, list) else None
+            if option_order is not None:
+                change.update(option_order=option_order, presented_options=None)
+            index = answer_index(question['options'], row.user_answer)
+            if index is not None:
+                change.update(answer_index=index, user_answer=None)
+            if len(change) > 1 or row.option_set_id is None:
+                changes.append(dict(change, option_set_id=option_set_id))
+
+        if changes:
+            db.session.execute(update(QuestionResponse), changes)
+        db.session.commit()
+        compacted += len(changes)
+
+    return compacted
+
+
+def vacuum():
+    """Give the space freed by compaction back to the filesystem (SQLite only)"""
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.exec_driver_sql('VACUUM')
+    return True
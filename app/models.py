@@ -1,8 +1,10 @@
 # app/models.py
-from app import db, login_manager
+from app import db, login_manager, password_hasher
+from collections import OrderedDict
+from flask import current_app
 from flask_login import UserMixin
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+import threading, time
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -12,28 +14,96 @@ class User(db.Model, UserMixin):
     is_admin = db.Column(db.Boolean, default=False)
     quiz_attempts = db.relationship('QuizAttempt', backref='user', lazy=True)
     
+    # Hashing runs on the bounded pool in app.security and may raise HashingBusy
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
+
+class UserStats(db.Model):
+    # Running totals per user, kept up to date as attempts start and finish
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    completed = db.Column(db.Integer, default=0, nullable=False)
+    best_score = db.Column(db.Integer, nullable=True)
+    
+    @property
+    def completion_rate(self):
+        return (self.completed / self.attempts) * 100 if self.attempts else 0
 
 class Quiz(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    topic = db.Column(db.String(50), nullable=False)
+    topic = db.Column(db.String(50), unique=True, index=True, nullable=False)
     attempts = db.relationship('QuizAttempt', backref='quiz', lazy=True)
 
+class Question(db.Model):
+    id = db.Column(db.String(50), primary_key=True)  # Same ids as the JSON file
+    text = db.Column(db.String(500), nullable=False)
+    topic = db.Column(db.String(50), nullable=False)
+    level = db.Column(db.Integer, nullable=False)
+    points = db.Column(db.Integer, nullable=False)
+    correct_answer = db.Column(db.String(200), nullable=False)
+    ordinal = db.Column(db.Integer, nullable=False, default=0)  # Position in the imported file
+    content_hash = db.Column(db.String(40), nullable=True)  # Lets imports skip unchanged questions
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    options = db.relationship('QuestionOption', backref='question', lazy='selectin',
+                              order_by='QuestionOption.position', cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        db.Index('ix_question_topic_level', 'topic', 'level'),
+    )
+    
+    def to_dict(self):
+        """Return the question in the same shape as an entry of questions.json"""
+        return {
+            'id': self.id,
+            'text': self.text,
+            'options': [option.text for option in self.options],
+            'correct_answer': self.correct_answer,
+            'level': self.level,
+            'topic': self.topic,
+            'points': self.points
+        }
+
+class QuestionOption(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.String(50), db.ForeignKey('question.id'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)
+    text = db.Column(db.String(200), nullable=False)
+
+class OptionSet(db.Model):
+    # Every option list a question has had. Responses store their options and
+    # answer as positions in one of these (see app.response_codec), so editing
+    # a question's options never changes what past responses show.
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.String(50), nullable=False)
+    digest = db.Column(db.String(16), nullable=False)  # options_digest() of the list
+    options = db.Column(db.Text, nullable=False)  # JSON list
+    
+    __table_args__ = (
+        db.UniqueConstraint('question_id', 'digest', name='uq_option_set'),
+    )
+
 class QuizAttempt(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # Nullable for anonymous users
-    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False, index=True)
     level_reached = db.Column(db.Integer, default=1)
     score = db.Column(db.Integer, default=0)
-    date_attempted = db.Column(db.DateTime, default=datetime.utcnow)
+    date_attempted = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     is_complete = db.Column(db.Boolean, default=False)
     
     # Store individual question responses
     responses = db.relationship('QuestionResponse', backref='attempt', lazy=True, cascade="all, delete-orphan")
+    
+    # Also serves lookups by user_id alone, so user_id needs no index of its own
+    __table_args__ = (
+        db.Index('ix_quiz_attempt_user_date', 'user_id', 'date_attempted'),
+    )
 
 
 class QuestionResponse(db.Model):
@@ -45,7 +115,169 @@ class QuestionResponse(db.Model):
     time_taken = db.Column(db.Integer, nullable=True)  # Time in seconds
     points = db.Column(db.Integer, default=0)  # Points earned or lost
     presented_options = db.Column(db.String(500), nullable=True)  # Store options as JSON string
+    # Compact form of the two text columns above: positions in the OptionSet
+    # the question had when it was answered, see app.response_codec. The text
+    # columns are only filled when an option isn't in that set.
+    option_order = db.Column(db.BigInteger, nullable=True)
+    answer_index = db.Column(db.SmallInteger, nullable=True)
+    option_set_id = db.Column(db.Integer, nullable=True)
+    
+    # Denormalized from the question bank so reports can aggregate in SQL.
+    # The (attempt_id, level) index also serves lookups by attempt_id alone.
+    level = db.Column(db.Integer, nullable=True)
+    topic = db.Column(db.String(50), nullable=True)
+    possible_points = db.Column(db.Integer, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_question_response_attempt_level', 'attempt_id', 'level'),
+        # One response per question and attempt, so writing one twice is a no-op
+        db.Index('ix_question_response_attempt_question', 'attempt_id', 'question_id', unique=True),
+    )
+
+class ArchivedAttempt(db.Model):
+    # An attempt moved out of quiz_attempt by app.archive, with the segment
+    # file that holds it and its responses. Same id and columns as the
+    # attempt, so history pages can list it until it is restored.
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
+    level_reached = db.Column(db.Integer, nullable=True)
+    score = db.Column(db.Integer, nullable=True)
+    date_attempted = db.Column(db.DateTime, nullable=True)
+    is_complete = db.Column(db.Boolean, nullable=True)
+    segment = db.Column(db.String(100), nullable=False, index=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    quiz = db.relationship('Quiz')
+
+    __table_args__ = (
+        db.Index('ix_archived_attempt_user_date', 'user_id', 'date_attempted'),
+    )
+
+class ArchiveSummary(db.Model):
+    # Counts of archived attempts per day, quiz, level reached and outcome,
+    # so dashboards keep counting them after their rows are gone
+    day = db.Column(db.Date, primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), primary_key=True)
+    level_reached = db.Column(db.Integer, primary_key=True)
+    is_complete = db.Column(db.Boolean, primary_key=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    anonymous = db.Column(db.Integer, default=0, nullable=False)
+    responses = db.Column(db.Integer, default=0, nullable=False)
+    correct = db.Column(db.Integer, default=0, nullable=False)
+    score = db.Column(db.Integer, default=0, nullable=False)
+
+class LeaderboardEntry(db.Model):
+    # Best finished score per user, topic and period ('daily', 'weekly', 'all')
+    id = db.Column(db.Integer, primary_key=True)
+    topic = db.Column(db.String(50), nullable=False)
+    period = db.Column(db.String(10), nullable=False)
+    period_start = db.Column(db.Date, nullable=False)  # Day, Monday of the week, or 1970-01-01 for 'all'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    best_score = db.Column(db.Integer, nullable=False)
+    achieved_at = db.Column(db.DateTime, nullable=False)
+    user = db.relationship('User')
+    
+    __table_args__ = (
+        db.UniqueConstraint('topic', 'period', 'period_start', 'user_id', name='uq_leaderboard_entry'),
+        # Ranking reads: top N and "how many scored higher" are range scans on this
+        db.Index('ix_leaderboard_rank', 'topic', 'period', 'period_start', 'best_score'),
+    )
+
+class QuestionSlot(db.Model):
+    # The bit a question has in its level's SeenQuestions bitmaps. Slots are
+    # handed out once per topic and level and never reused, so adding,
+    # removing or moving questions never gives a bit to another question.
+    topic = db.Column(db.String(50), primary_key=True)
+    level = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.String(50), primary_key=True)
+    slot = db.Column(db.Integer, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('topic', 'level', 'slot', name='uq_question_slot'),
+    )
+
+class SeenQuestions(db.Model):
+    # Questions a user has been asked, per topic and level, as a bitmap over the
+    # level's question slots (see QuestionSlot); bytes little-endian
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    topic = db.Column(db.String(50), primary_key=True)
+    level = db.Column(db.Integer, primary_key=True)
+    mask = db.Column(db.LargeBinary, nullable=False, default=b'')
+
+class QuestionStats(db.Model):
+    # Running per-question aggregates, maintained by app.analytics
+    question_id = db.Column(db.String(50), primary_key=True)
+    topic = db.Column(db.String(50), nullable=True, index=True)
+    level = db.Column(db.Integer, nullable=True)
+    answered = db.Column(db.Integer, default=0, nullable=False)
+    skipped = db.Column(db.Integer, default=0, nullable=False)
+    correct = db.Column(db.Integer, default=0, nullable=False)
+    time_total = db.Column(db.Integer, default=0, nullable=False)  # Seconds, answered responses only
+    time_histogram = db.Column(db.Text, nullable=False, default='[]')  # JSON counts per whole second
+    distractor_counts = db.Column(db.Text, nullable=False, default='{}')  # JSON {wrong answer: picks}
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @property
+    def accuracy(self):
+        return (self.correct / self.answered) * 100 if self.answered else 0
+    
+    @property
+    def mean_time(self):
+        return self.time_total / self.answered if self.answered else 0
+
+class AnalyticsWatermark(db.Model):
+    # Last response id folded into the aggregates of each analytics job
+    name = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class QuizSession(db.Model):
+    key = db.Column(db.String(64), primary_key=True)  # Attempt ID
+    data = db.Column(db.Text, nullable=False)  # Quiz state as JSON
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class UserPrincipal(UserMixin):
+    """Read-only stand-in for User as current_user, detached from any session"""
+    
+    def __init__(self, id, username, email, is_admin):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.is_admin = bool(is_admin)
+
+# Principals by (database, user id) with their expiry time, least recently used first
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+USER_CACHE_SIZE = 10000
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
\ No newline at end of file
+    user_id = int(user_id)
+    key = (str(db.engine.url), user_id)
+    now = time.monotonic()
+    with _user_cache_lock:
+        hit = _user_cache.get(key)
+        if hit and hit[0] > now:
+            _user_cache.move_to_end(key)
+            return hit[1]
+    
+    row = db.session.query(User.id, User.username, User.email, User.is_admin).filter_by(id=user_id).first()
+    if row is None:
+        return None
+    principal = UserPrincipal(*row)
+    
+    ttl = current_app.config.get('USER_CACHE_TTL', 300)
+    if ttl:
+        with _user_cache_lock:
+            _user_cache[key] = (now + ttl, principal)
+            _user_cache.move_to_end(key)
+            while len(_user_cache) > USER_CACHE_SIZE:
+                _user_cache.popitem(last=False)
+    return principal
+
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def _forget_cached_user(mapper, connection, user):
+    # Profile or admin flag changed in this process; other processes catch up within USER_CACHE_TTL
+    with _user_cache_lock:
+        _user_cache.pop((str(connection.engine.url), user.id), None)
\ No newline at end of file
@@ -0,0 +1,99 @@
+# app/page_cache.py
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+import hashlib, threading, time
+
+
+class PageCache:
+    """Cache of fully rendered pages that look the same for many visitors.
+
+    A cached page is stored per path, per visitor kind (anonymous, user or
+    admin, which is all the navigation bar varies on) and per question bank
+    version, so editing the questions invalidates every page at once;
+    clear() drops everything explicitly. Hits skip the view and the template
+    engine, and carry an ETag and Last-Modified header so browsers can
+    revalidate with a 304. Requests with pending flash messages are never
+    cached. ``PAGE_CACHE_TTL = 0`` turns the cache off.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 300
+        self.max_entries = 256
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('PAGE_CACHE_TTL', 300)
+        app.extensions['page_cache'] = self
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _variant(self):
+        if not current_user.is_authenticated:
+            return 'anonymous'
+        return 'admin' if current_user.is_admin else 'user'
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry['stored'] >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, response):
+        body = response.get_data()
+        entry = {
+            'stored': time.monotonic(),
+            'body': body,
+            'mimetype': response.mimetype,
+            'etag': hashlib.sha1(body).hexdigest(),
+            'last_modified': datetime.now(timezone.utc).replace(microsecond=0),
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def cached(self, view):
+        """Decorate a GET view whose output only depends on the URL and visitor kind"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.ttl or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            from app import question_bank
+            variant = self._variant()
+            key = (request.full_path, variant, question_bank.version)
+            entry = self._get(key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+                entry = self._put(key, response)
+
+            response = current_app.response_class(entry['body'], mimetype=entry['mimetype'])
+            response.set_etag(entry['etag'])
+            response.last_modified = entry['last_modified']
+            # Logged-in pages differ per visitor kind: revalidate rather than share them
+            if variant == 'anonymous':
+                response.cache_control.public = True
+                response.cache_control.max_age = 60
+            else:
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response.make_conditional(request)
+        return wrapper
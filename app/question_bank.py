@@ -0,0 +1,369 @@
+# app/question_bank.py
+import json
+import os
+import random
+import threading
+import time
+
+
+class QuestionBank:
+    """In-memory question bank loaded once per process.
+
+    Questions are indexed by id and by (topic, level). They are read either
+    from the JSON file (``QUESTION_BANK_SOURCE = 'json'``) or from the
+    question tables (``'database'``). The source is re-checked at most every
+    ``QUESTION_BANK_RELOAD_INTERVAL`` seconds and reloaded when it changes
+    (file mtime, or row count and last update time), so content edits are
+    picked up without restarting the app. From the database only the rows
+    updated since the last check are re-read, unless some were deleted.
+
+    Each question's option list is also kept as an OptionSet row, which
+    responses refer to (see app.response_codec), and each question has a
+    QuestionSlot, its bit in seen-question bitmaps (see app.seen_questions).
+    Loads only look the rows up; missing ones are stored the first time
+    they are needed.
+    """
+
+    def __init__(self, app=None):
+        self.path = None
+        self.source = 'json'
+        self.reload_interval = 2.0
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._by_level = {}
+        self._slots = {}
+        self._slot_pools = {}
+        self._unslotted = set()
+        self._slots_recorded = False
+        self._option_sets = {}
+        self._unrecorded = set()
+        self._stamp = None
+        self._last_check = 0.0
+        self.loads = 0  # (Re)loads so far and the time they took, for /metrics
+        self.load_seconds = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        path = app.config.get('QUESTIONS_FILE', 'questions.json')
+        if not os.path.isabs(path):
+            # Resolve relative to the project root rather than the CWD
+            path = os.path.join(os.path.dirname(app.root_path), path)
+        self.path = path
+        self.source = app.config.get('QUESTION_BANK_SOURCE', 'json')
+        self.reload_interval = app.config.get('QUESTION_BANK_RELOAD_INTERVAL', 2.0)
+        app.extensions['question_bank'] = self
+
+    def _current_stamp(self):
+        if self.source == 'database':
+            from app import db
+            from app.models import Question
+            return tuple(db.session.query(
+                db.func.count(Question.id), db.func.max(Question.updated_at)
+            ).one())
+        return os.stat(self.path).st_mtime_ns
+
+    def _read_questions(self):
+        if self.source == 'database':
+            from app.models import Question
+            return [q.to_dict() for q in Question.query.order_by(Question.ordinal.asc())]
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _load(self, stamp):
+        by_id = {}
+        by_level = {}
+        for q in self._read_questions():
+            by_id[q['id']] = q
+            by_level.setdefault((q['topic'], q['level']), []).append(q)
+
+        slots = self._find_question_slots()
+        slot_pools, unslotted = _slot_pools(by_level, slots)
+        option_sets = self._find_option_sets(by_id.values())
+
+        # Swap the indexes in one go so readers never see a half-built bank
+        self._by_id, self._by_level = by_id, by_level
+        self._slots, self._slot_pools, self._unslotted, self._slots_recorded = slots, slot_pools, unslotted, False
+        self._option_sets, self._unrecorded = option_sets, set(by_id) - set(option_sets)
+        self._stamp = stamp
+
+    def _load_changes(self, stamp):
+        """Re-index only the questions updated since the last load.
+
+        Returns False when that is not possible (JSON source, first load, or
+        deleted rows) and the bank has to be reloaded in full.
+        """
+        if self.source != 'database' or self._stamp is None or self._stamp[1] is None:
+            return False
+
+        from app.models import Question
+        changed = [q.to_dict() for q in Question.query
+                   .filter(Question.updated_at > self._stamp[1])
+                   .order_by(Question.ordinal.asc())]
+        added = sum(1 for q in changed if q['id'] not in self._by_id)
+        if self._stamp[0] + added != stamp[0]:
+            return False
+
+        # Copy only the pools that change, then swap as in _load()
+        by_id = dict(self._by_id)
+        by_level = dict(self._by_level)
+        for q in changed:
+            old = by_id.get(q['id'])
+            key = (q['topic'], q['level'])
+            if old is not None and (old['topic'], old['level']) == key:
+                # Edited in place: keeps its place in the pool
+                by_level[key] = [q if p['id'] == q['id'] else p for p in by_level[key]]
+            else:
+                if old is not None:
+                    old_key = (old['topic'], old['level'])
+                    by_level[old_key] = [p for p in by_level[old_key] if p['id'] != q['id']]
+                by_level[key] = by_level.get(key, []) + [q]
+            by_id[q['id']] = q
+
+        # Slots are never taken back, so the ones already read still hold
+        slot_pools, unslotted = _slot_pools(by_level, self._slots)
+
+        option_sets = dict(self._option_sets)
+        for q in changed:
+            option_sets.pop(q['id'], None)
+        option_sets.update(self._find_option_sets(changed))
+
+        self._by_id, self._by_level = by_id, by_level
+        self._slot_pools, self._unslotted, self._slots_recorded = slot_pools, unslotted, False
+        self._option_sets = option_sets
+        self._unrecorded = self._unrecorded | {q['id'] for q in changed if q['id'] not in option_sets}
+        self._stamp = stamp
+        return True
+
+    def _find_question_slots(self):
+        from flask import current_app
+        from app.seen_questions import find_question_slots
+        from sqlalchemy.exc import SQLAlchemyError
+        try:
+            return find_question_slots()
+        except SQLAlchemyError:
+            # No question_slot table yet: levels are drawn without seen bitmaps
+            current_app.logger.warning('Could not read question slots', exc_info=True)
+            return {}
+
+    def _find_option_sets(self, questions):
+        from flask import current_app
+        from app.response_codec import find_option_sets
+        from sqlalchemy.exc import SQLAlchemyError
+        try:
+            return find_option_sets(list(questions))
+        except SQLAlchemyError:
+            # No option_set table yet (`flask db upgrade` not run): responses keep their text
+            current_app.logger.warning('Could not read option sets', exc_info=True)
+            return {}
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._stamp is not None and now - self._last_check < self.reload_interval:
+            return
+
+        with self._lock:
+            if self._stamp is not None and now - self._last_check < self.reload_interval:
+                return
+            stamp = self._current_stamp()
+            if stamp != self._stamp:
+                started = time.perf_counter()
+                if not self._load_changes(stamp):
+                    self._load(stamp)
+                self.loads += 1
+                self.load_seconds += time.perf_counter() - started
+            self._last_check = now
+
+    @property
+    def version(self):
+        """Opaque value that changes whenever the questions are reloaded"""
+        self._ensure_fresh()
+        return self._stamp
+
+    def get(self, question_id):
+        """Return the question with the given id, or None"""
+        self._ensure_fresh()
+        return self._by_id.get(question_id)
+
+    def for_level(self, topic, level):
+        """Return all questions for a topic and level"""
+        self._ensure_fresh()
+        return self._by_level.get((topic, level), [])
+
+    def sample(self, topic, level, k):
+        """Return up to k random questions for a topic and level"""
+        if self.source == 'database':
+            from app.question_store import sample_question_ids
+            self._ensure_fresh()
+            sampled = (self._by_id.get(qid) for qid in sample_question_ids(topic, level, k))
+            return [q for q in sampled if q]
+
+        pool = self.for_level(topic, level)
+        if len(pool) > k:
+            return random.sample(pool, k)
+        return list(pool)
+
+    def slot(self, topic, level, question_id):
+        """The bit a question has in the seen-question bitmaps of a level, or None"""
+        self._ensure_fresh()
+        return self._slots.get((topic, level, question_id))
+
+    def record_question_slots(self):
+        """Hand out slots to questions that have none yet, on a separate connection.
+
+        Tried once per (re)load; `flask db upgrade` does it for deploys.
+        """
+        self._ensure_fresh()
+        if not self._unslotted or self._slots_recorded:
+            return
+
+        from flask import current_app
+        from app.seen_questions import record_question_slots
+        from sqlalchemy.exc import SQLAlchemyError
+        with self._lock:
+            pools = {key: self._by_level[key] for key in self._unslotted if key in self._by_level}
+            try:
+                recorded = record_question_slots(pools) if pools else {}
+            except SQLAlchemyError:
+                current_app.logger.warning('Could not record question slots', exc_info=True)
+                recorded = {}
+            slots = dict(self._slots)
+            slots.update(recorded)
+            self._slot_pools, self._unslotted = _slot_pools(self._by_level, slots)
+            self._slots, self._slots_recorded = slots, True
+
+    def option_set_id(self, question_id, record=False):
+        """OptionSet id of a question's current options, or None.
+
+        With `record`, questions without one get theirs stored first
+        (see record_option_sets()).
+        """
+        if record:
+            self.record_option_sets()
+        else:
+            self._ensure_fresh()
+        return self._option_sets.get(question_id)
+
+    def record_option_sets(self):
+        """Store the option lists that have no OptionSet yet, on a separate connection.
+
+        Tried once per (re)load; `flask db upgrade` does it for deploys.
+        """
+        self._ensure_fresh()
+        if not self._unrecorded:
+            return
+
+        from flask import current_app
+        from app.response_codec import record_option_sets
+        from sqlalchemy.exc import SQLAlchemyError
+        with self._lock:
+            questions = [self._by_id[qid] for qid in self._unrecorded if qid in self._by_id]
+            try:
+                recorded = record_option_sets(questions) if questions else {}
+            except SQLAlchemyError:
+                current_app.logger.warning('Could not record option sets', exc_info=True)
+                recorded = {}
+            self._option_sets = dict(self._option_sets, **recorded)
+            self._unrecorded = set()
+
+    def sample_unseen(self, topic, level, k, seen=0):
+        """Return (questions, seen): up to k random questions whose bit is not set in `seen`.
+
+        `seen` is a bitmap over the level's slots, bit i standing for the
+        question with slot(topic, level, ...) i. Slots of questions that
+        left the level are never drawn. When fewer than k questions are
+        unseen the pool starts over: all unseen questions are taken, the
+        rest are drawn from the others and the returned bitmap is 0. Cost
+        grows with the number of slots / 64 and k, not with how many
+        questions were seen.
+        """
+        self.record_question_slots()
+        if (topic, level) in self._unslotted:
+            # Some questions have no slot (`flask db upgrade` not run); bits can't be trusted
+            return self.sample(topic, level, k), seen
+
+        pool, live = self._slot_pools.get((topic, level), ([], 0))
+        size = len(pool)
+        unseen = ~seen & live
+        available = unseen.bit_count()
+
+        if available >= k:
+            picked = _random_bits(unseen, size, available, k)
+        else:
+            picked = _set_bits(unseen)
+            picked += random.sample(_set_bits(live & ~unseen), min(k, live.bit_count()) - len(picked))
+            random.shuffle(picked)
+            seen = 0
+        return [pool[i] for i in picked], seen
+
+    def level_points(self, topic, level, default=10):
+        """Return the points awarded per question for a topic and level"""
+        pool = self.for_level(topic, level)
+        return pool[0]['points'] if pool else default
+
+
+def _slot_pools(by_level, slots):
+    """Index the pools by slot: ({(topic, level): (questions by slot, bitmap of the taken slots)},
+    the pools with questions that have no slot)"""
+    slot_pools, unslotted = {}, set()
+    for (topic, level), pool in by_level.items():
+        taken = {}
+        for q in pool:
+            slot = slots.get((topic, level, q['id']))
+            if slot is None:
+                unslotted.add((topic, level))
+            else:
+                taken[slot] = q
+        questions = [None] * (max(taken, default=-1) + 1)
+        live = 0
+        for slot, q in taken.items():
+            questions[slot] = q
+            live |= 1 << slot
+        slot_pools[(topic, level)] = (questions, live)
+    return slot_pools, unslotted
+
+
+def _set_bits(mask):
+    """Positions of the set bits of a non-negative int, scanned 64 bits at a time"""
+    positions = []
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+    for offset in range(0, len(data), 8):
+        word = int.from_bytes(data[offset:offset + 8], 'little')
+        while word:
+            lowest = word & -word
+            positions.append(offset * 8 + lowest.bit_length() - 1)
+            word ^= lowest
+    return positions
+
+
+def _random_bits(mask, size, available, k):
+    """k distinct random positions among the `available` set bits of mask"""
+    if available * 8 >= size:
+        # Mostly unseen: probe random positions, under 8 tries per pick on average
+        picked, chosen = [], set()
+        while len(picked) < k:
+            position = random.randrange(size)
+            if position not in chosen and mask >> position & 1:
+                chosen.add(position)
+                picked.append(position)
+        return picked
+
+    # Mostly seen: pick k ranks among the set bits and find them word by word
+    ranks = sorted(random.sample(range(available), k))
+    picked = []
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+    counted = 0
+    for offset in range(0, len(data), 8):
+        word = int.from_bytes(data[offset:offset + 8], 'little')
+        in_word = word.bit_count()
+        while ranks and ranks[0] < counted + in_word:
+            # Drop the set bits below the wanted one, then take the lowest
+            bits = word
+            for _ in range(ranks.pop(0) - counted):
+                bits &= bits - 1
+            picked.append(offset * 8 + (bits & -bits).bit_length() - 1)
+        counted += in_word
+        if not ranks:
+            break
+    random.shuffle(picked)
+    return picked
\ No newline at end of file
@@ -0,0 +1,187 @@
+# app/question_import.py
+from collections import Counter
+import hashlib, json, os, shutil
+
+REQUIRED_FIELDS = {
+    'id': str,
+    'text': str,
+    'options': list,
+    'correct_answer': str,
+    'level': int,
+    'topic': str,
+    'points': int,
+}
+MIN_DISTRACTORS = 3  # A question shows the correct answer and 3 wrong options
+MIN_QUESTIONS_PER_LEVEL = 10  # A level is 10 questions
+
+READ_SIZE = 64 * 1024
+MAX_ENTRY_SIZE = 1024 * 1024  # Give up on an entry that is still unparsable after this much text
+
+
+def iter_questions(path):
+    """Yield question dicts from a JSON array file or a JSONL file, one at a time.
+
+    The JSON array is decoded incrementally with raw_decode, so only the
+    entry being parsed (plus one read buffer) is ever held in memory.
+    """
+    if path.endswith('.jsonl'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError as e:
+                        raise ValueError(f'{path}:{line_number}: {e}') from None
+        return
+
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(READ_SIZE).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f'{path}: expected a JSON array of questions')
+        pos = 1
+        while True:
+            # Skip whitespace and the separator before the next entry
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buffer):
+                buffer, pos = f.read(READ_SIZE), 0
+                if not buffer:
+                    raise ValueError(f'{path}: unexpected end of file')
+                continue
+
+            if buffer[pos] == ']':
+                return
+
+            try:
+                entry, pos = decoder.raw_decode(buffer, pos)
+            except ValueError as e:
+                # Entry continues past the buffer: read more and try again
+                chunk = f.read(READ_SIZE)
+                if not chunk or len(buffer) - pos > MAX_ENTRY_SIZE:
+                    raise ValueError(f'{path}: {e}') from None
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield entry
+
+
+def content_hash(question):
+    """Stable hash of a question's content, used to skip unchanged questions"""
+    canonical = json.dumps({field: question[field] for field in REQUIRED_FIELDS},
+                           sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+def validate_questions(questions):
+    """Check a whole bank in one pass and return every problem found.
+
+    Each entry must have the questions.json fields with the right types, a
+    unique id, its correct answer among its options and at least 3 other
+    options; every topic and level must have at least 10 questions. Returns
+    (number of questions, list of error strings).
+    """
+    errors = []
+    seen_ids = set()
+    per_level = Counter()
+    count = 0
+
+    for count, question in enumerate(questions, 1):
+        label = f'question #{count}'
+        if not isinstance(question, dict):
+            errors.append(f'{label}: expected an object')
+            continue
+        if isinstance(question.get('id'), str):
+            label += f' ({question["id"]})'
+
+        problems = []
+        for field, kind in REQUIRED_FIELDS.items():
+            if field not in question:
+                problems.append(f'missing "{field}"')
+            elif not isinstance(question[field], kind) or isinstance(question[field], bool):
+                problems.append(f'"{field}" should be {kind.__name__}')
+        if problems:
+            errors.append(f'{label}: ' + ', '.join(problems))
+            continue
+
+        if question['id'] in seen_ids:
+            errors.append(f'{label}: duplicate id')
+        seen_ids.add(question['id'])
+
+        options = question['options']
+        if not all(isinstance(option, str) for option in options):
+            errors.append(f'{label}: options should be strings')
+        if question['correct_answer'] not in options:
+            errors.append(f'{label}: correct answer {question["correct_answer"]!r} is not one of the options')
+        distractors = len({option for option in options if option != question['correct_answer']})
+        if distractors < MIN_DISTRACTORS:
+            errors.append(f'{label}: {distractors} incorrect options, needs at least {MIN_DISTRACTORS}')
+        if question['points'] <= 0:
+            errors.append(f'{label}: points should be positive')
+
+        per_level[(question['topic'], question['level'])] += 1
+
+    for (topic, level), total in sorted(per_level.items()):
+        if total < MIN_QUESTIONS_PER_LEVEL:
+            errors.append(f'{topic} level {level}: {total} questions, needs at least {MIN_QUESTIONS_PER_LEVEL}')
+
+    return count, errors
+
+
+def format_question(question):
+    """Render a question in the questions.json layout: one key per line, options inline"""
+    return '  {\n' + ',\n'.join(
+        f'    {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}'
+        for key, value in question.items()
+    ) + '\n  }'
+
+
+def write_questions(questions, f):
+    """Stream questions to an open file as a questions.json array"""
+    f.write('[\n')
+    for i, question in enumerate(questions):
+        f.write((',\n' if i else '') + format_question(question))
+    f.write('\n]\n')
+
+
+def import_to_file(path, target):
+    """Make the JSON question file at `target` match the bank at `path`.
+
+    The file is only rewritten, and so only reloaded by running apps, when a
+    question was added, changed or removed. The new file is written next to
+    the old one and swapped in atomically. Returns the same counts as
+    question_store.import_questions().
+    """
+    counts = {'created': 0, 'updated': 0, 'deleted': 0}
+    if os.path.exists(target) and os.path.samefile(path, target):
+        return counts
+
+    old = {q['id']: content_hash(q) for q in iter_questions(target)} if os.path.exists(target) else {}
+    seen = set()
+
+    def tracked():
+        for question in iter_questions(path):
+            stored = old.get(question['id'])
+            if stored is None:
+                counts['created'] += 1
+            elif stored != content_hash(question):
+                counts['updated'] += 1
+            seen.add(question['id'])
+            yield question
+
+    # A JSON source is copied as is, keeping its formatting; JSONL is converted
+    temp_path = target + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            write_questions(tracked(), f)
+        else:
+            for _ in tracked():
+                pass
+            with open(path, 'r', encoding='utf-8') as source:
+                shutil.copyfileobj(source, f)
+    counts['deleted'] = len(old.keys() - seen)
+
+    if any(counts.values()):
+        os.replace(temp_path, target)
+    else:
+        os.remove(temp_path)
+    return counts
@@ -0,0 +1,117 @@
+# app/question_store.py
+from app import db
+from app.models import Question, QuestionOption
+from app.question_import import content_hash
+from sqlalchemy import func, insert
+
+
+def _random_order():
+    # MySQL spells it RAND(); SQLite and PostgreSQL use RANDOM()
+    if db.engine.dialect.name == 'mysql':
+        return func.rand()
+    return func.random()
+
+
+def sample_question_ids(topic, level, k):
+    """Pick up to k random question ids for a topic and level in the database"""
+    rows = db.session.query(Question.id)\
+        .filter(Question.topic == topic, Question.level == level)\
+        .order_by(_random_order())\
+        .limit(k).all()
+    return [row.id for row in rows]
+
+
+def import_questions(questions, prune=False, batch_size=1000):
+    """Insert or update questions from an iterable of questions.json entries.
+
+    Entries are handled `batch_size` at a time and compared by content hash,
+    so unchanged questions cost one indexed lookup and memory use does not
+    grow with the size of the bank. With prune=True, questions that are not
+    in `questions` are deleted. Everything runs in one transaction. Returns
+    a dict with the number of questions created, updated and deleted.
+    """
+    counts = {'created': 0, 'updated': 0, 'deleted': 0}
+    seen = set()
+    
+    # New questions are appended after the existing ones, in file order
+    next_ordinal = db.session.query(func.coalesce(func.max(Question.ordinal), -1)).scalar() + 1
+
+    batch = []
+    for data in questions:
+        batch.append(data)
+        if len(batch) >= batch_size:
+            next_ordinal = _import_batch(batch, counts, seen, next_ordinal)
+            batch = []
+    if batch:
+        _import_batch(batch, counts, seen, next_ordinal)
+
+    if prune:
+        stale = [question_id for (question_id,) in db.session.query(Question.id).yield_per(batch_size)
+                 if question_id not in seen]
+        for i in range(0, len(stale), batch_size):
+            ids = stale[i:i + batch_size]
+            QuestionOption.query.filter(QuestionOption.question_id.in_(ids)).delete(synchronize_session=False)
+            Question.query.filter(Question.id.in_(ids)).delete(synchronize_session=False)
+        counts['deleted'] = len(stale)
+
+    db.session.commit()
+    return counts
+
+
+def _import_batch(batch, counts, seen, next_ordinal):
+    hashes = {data['id']: content_hash(data) for data in batch}
+    seen.update(hashes)
+    stored = dict(db.session.query(Question.id, Question.content_hash).filter(Question.id.in_(list(hashes))))
+    changed = [data for data in batch if stored.get(data['id'], '') != hashes[data['id']]]
+    existing = {
+        q.id: q for q in Question.query.filter(Question.id.in_([d['id'] for d in changed if d['id'] in stored]))
+    }
+
+    # New questions and their options go in as plain bulk inserts
+    created = [data for data in changed if data['id'] not in stored]
+    if created:
+        db.session.execute(insert(Question), [
+            {'id': data['id'], 'text': data['text'], 'topic': data['topic'], 'level': data['level'],
+             'points': data['points'], 'correct_answer': data['correct_answer'],
+             'ordinal': next_ordinal + i, 'content_hash': hashes[data['id']]}
+            for i, data in enumerate(created)
+        ])
+        db.session.execute(insert(QuestionOption), [
+            {'question_id': data['id'], 'position': position, 'text': text}
+            for data in created for position, text in enumerate(data['options'])
+        ])
+        next_ordinal += len(created)
+        counts['created'] += len(created)
+
+    for data in changed:
+        question = existing.get(data['id'])
+        if question is None:
+            continue  # Created above
+        if stored[data['id']] is None and question.to_dict() == data:
+            # Imported before hashes were stored, and unchanged since
+            question.content_hash = hashes[data['id']]
+            continue
+        else:
+            counts['updated'] += 1
+
+        question.text = data['text']
+        question.topic = data['topic']
+        question.level = data['level']
+        question.points = data['points']
+        question.correct_answer = data['correct_answer']
+        question.content_hash = hashes[data['id']]
+        question.options = [
+            QuestionOption(position=position, text=text)
+            for position, text in enumerate(data['options'])
+        ]
+
+    # Write the batch and drop it from the session to keep memory flat
+    db.session.flush()
+    db.session.expunge_all()
+    return next_ordinal
+
+
+def export_questions(batch_size=1000):
+    """Yield every question as a questions.json entry, in file order"""
+    for question in Question.query.order_by(Question.ordinal.asc()).yield_per(batch_size):
+        yield question.to_dict()
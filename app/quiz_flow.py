@@ -0,0 +1,246 @@
+# app/quiz_flow.py
+from flask import current_app
+from app import db, question_bank, quiz_sessions
+from app.models import Quiz, QuizAttempt, QuestionResponse
+from app.reports import build_level_reports
+from app.user_stats import record_attempt_finished
+from app.leaderboard import record_finished_attempt
+from app.response_codec import encode_response
+from app.seen_questions import choose_questions, mark_seen
+from sqlalchemy import func, insert, select
+import random, time
+
+QUESTIONS_PER_LEVEL = 10
+PASS_PERCENTAGE = 60
+
+
+def load_level_questions(state, topic, level):
+    """Pick the level's questions and shuffle their options up front.
+
+    The options shown for question i are state['level_options'][i], so any
+    question of the level can be served (or prefetched) without further work.
+    Logged-in players get questions they haven't been asked before.
+    """
+    if state.get('user_id') is not None:
+        level_questions = choose_questions(state['user_id'], topic, level, QUESTIONS_PER_LEVEL)
+    else:
+        level_questions = question_bank.sample(topic, level, QUESTIONS_PER_LEVEL)
+
+    level_options = []
+    for question in level_questions:
+        # The correct answer and 3 random incorrect options, in random order
+        correct_answer = question['correct_answer']
+        incorrect_options = [opt for opt in question['options'] if opt != correct_answer]
+        options = random.sample(incorrect_options, min(3, len(incorrect_options))) + [correct_answer]
+        random.shuffle(options)
+        level_options.append(options)
+
+    state['level_questions'] = [q['id'] for q in level_questions]
+    state['level_options'] = level_options
+    state['questions_answered'] = 0
+    set_current(state)
+
+
+def question_at(state, index):
+    """Return (question, options) for the index-th question of the level, or (None, None)"""
+    level_questions = state.get('level_questions', [])
+    if not 0 <= index < len(level_questions):
+        return None, None
+    question = question_bank.get(level_questions[index])
+    if question is None:
+        return None, None
+
+    level_options = state.get('level_options')
+    if level_options and index < len(level_options):
+        return question, level_options[index]
+
+    # States saved before options were prepared per level
+    correct_answer = question['correct_answer']
+    incorrect_options = [opt for opt in question['options'] if opt != correct_answer]
+    options = random.sample(incorrect_options, min(3, len(incorrect_options))) + [correct_answer]
+    random.shuffle(options)
+    return question, options
+
+
+def set_current(state):
+    """Point the state at the next unanswered question.
+
+    Done whenever the state is written anyway (a level loaded, an answer
+    recorded), so showing the question doesn't have to write it again.
+    """
+    question, options = question_at(state, state.get('questions_answered', 0))
+    if question:
+        state.set('current_question', question['id'])
+        state.set('current_options', options)
+
+
+def score_answer(question, answer, time_taken):
+    """Return (is_correct, points) for an answer given after `time_taken` seconds.
+
+    Correct answers earn the question's points, skips and timeouts earn
+    nothing, and a wrong answer costs half the points (negative marking).
+    """
+    is_correct = answer == question['correct_answer'] if answer else False
+    if is_correct:
+        return True, question['points']
+    if not answer or time_taken >= 30:
+        return False, 0
+    return False, -question['points'] // 2
+
+
+def answer_question(state, question, options, answer, time_taken, skipped=False):
+    """Score and record an answer to the current question.
+
+    Returns (is_correct, points); the level is over once
+    state['questions_answered'] reaches QUESTIONS_PER_LEVEL.
+    """
+    if skipped:
+        # No answer and no time recorded for skipped questions
+        answer, is_correct, points, time_taken = None, False, 0, 0
+    else:
+        is_correct, points = score_answer(question, answer, time_taken)
+
+    # Save the response with the options that were presented to the user,
+    # stored as positions in the question's options
+    record_response(
+        state,
+        question_id=question['id'],
+        is_correct=is_correct,
+        time_taken=time_taken,
+        points=points,
+        level=question['level'],
+        topic=question['topic'],
+        possible_points=question['points'],
+        **encode_response(question, options, answer)
+    )
+    state['questions_answered'] = state.get('questions_answered', 0) + 1
+    set_current(state)
+    return is_correct, points
+
+
+def complete_level(state):
+    """Score the level just played and advance or finish the attempt.
+
+    Returns the figures shown on the level complete page. Calling it again
+    for the same level (a reload, or the API and the page both asking)
+    returns the same summary without updating the attempt twice.
+    """
+    # Write any buffered responses before building the report
+    flush_responses(state)
+
+    attempt = QuizAttempt.query.get(state.attempt_id)
+    level = state.get('level', 1)
+    topic = Quiz.query.get(attempt.quiz_id).topic
+    total_possible_points = QUESTIONS_PER_LEVEL * question_bank.level_points(topic, level)
+
+    # Build the report for the first 10 responses of this level
+    report = build_level_reports(attempt.id, level=level, limit=QUESTIONS_PER_LEVEL).get(level, {})
+    total_correct = report.get('total_correct', 0)
+    total_questions = report.get('total_questions', 0)
+    score = max(0, report.get('total_points', 0))  # Display score is never negative
+    percentage_points = (score / total_possible_points) * 100 if total_possible_points > 0 else 0
+    passed = percentage_points >= PASS_PERCENTAGE
+
+    if passed and level < 4:
+        attempt.level_reached = level + 1
+        db.session.commit()
+    elif not attempt.is_complete:
+        if passed:
+            # Level 5 marks that every level was cleared
+            attempt.level_reached = 5
+        finish_attempt(attempt, topic)
+
+    return {
+        'passed': passed,
+        'level': level,
+        'score': score,
+        'total_correct': total_correct,
+        'total_questions': total_questions,
+        'percentage_correct': (total_correct / total_questions) * 100 if total_questions > 0 else 0,
+        'percentage_points': percentage_points,
+        'total_possible_points': total_possible_points,
+        'next_level': level + 1 if passed and level < 4 else None,
+        'quiz_complete': passed and level == 4,
+        'questions_detail': report.get('responses', []),
+    }
+
+
+def _insert_responses():
+    """INSERT that skips responses already stored for their attempt and question"""
+    return insert(QuestionResponse).prefix_with('OR IGNORE', dialect='sqlite').prefix_with('IGNORE', dialect='mysql')
+
+
+def record_response(state, **fields):
+    """Record an answer (or skip) for the attempt in `state`.
+
+    By default the response is inserted and the attempt score updated
+    straight away. With RESPONSE_WRITE_BEHIND enabled the response is
+    buffered in the quiz state instead and written in bulk by
+    flush_responses(), either at the end of the level, once the oldest
+    buffered response is RESPONSE_FLUSH_INTERVAL seconds old, or when the
+    quiz state is left behind (see QuizSessions.register_buffer).
+    """
+    if not current_app.config.get('RESPONSE_WRITE_BEHIND'):
+        added = db.session.execute(_insert_responses().values(attempt_id=state.attempt_id, **fields)).rowcount
+        mark_seen(state.get('user_id'), fields['topic'], fields['level'], [fields['question_id']])
+        attempt = QuizAttempt.query.get(state.attempt_id)
+        if added:
+            attempt.score += fields['points']
+        state['score'] = attempt.score
+        db.session.commit()
+        return
+
+    pending = state.get('pending_responses', []) + [fields]
+    state['pending_responses'] = pending
+    state['score'] = state.get('score', 0) + fields['points']
+    if 'pending_since' not in state:
+        state['pending_since'] = time.time()
+
+    if time.time() - state['pending_since'] >= current_app.config.get('RESPONSE_FLUSH_INTERVAL', 120):
+        flush_responses(state)
+
+
+def finish_attempt(attempt, topic):
+    """Mark an attempt as finished and update the player's totals and leaderboards"""
+    attempt.is_complete = True
+    if attempt.user_id is not None:
+        record_attempt_finished(attempt)
+        record_finished_attempt(attempt, topic)
+    db.session.commit()
+
+
+def flush_responses(state):
+    """Bulk insert any buffered responses and apply their points to the attempt.
+
+    The sweep and the player's own requests may both flush the same buffer.
+    Responses already stored are skipped and the score is recounted from the
+    stored rows, so flushing twice writes each response and its points once.
+    """
+    pending = state.get('pending_responses')
+    if not pending:
+        return
+
+    db.session.execute(
+        _insert_responses(),
+        # Responses buffered before the compact columns existed lack their keys
+        [dict({'option_order': None, 'answer_index': None, 'option_set_id': None}, **fields,
+              attempt_id=state.attempt_id)
+         for fields in pending]
+    )
+    QuizAttempt.query.filter_by(id=state.attempt_id).update({QuizAttempt.score: select(
+        func.coalesce(func.sum(QuestionResponse.points), 0)
+    ).where(QuestionResponse.attempt_id == state.attempt_id).scalar_subquery()})
+    seen = {}
+    for fields in pending:
+        seen.setdefault((fields['topic'], fields['level']), []).append(fields['question_id'])
+    for (topic, level), question_ids in seen.items():
+        mark_seen(state.get('user_id'), topic, level, question_ids)
+    db.session.commit()
+
+    state['pending_responses'] = []
+    state.pop('pending_since', None)
+
+
+# Buffered responses are written before their quiz state is replaced, ended,
+# evicted or expires, and once nobody has answered for RESPONSE_FLUSH_INTERVAL
+quiz_sessions.register_buffer('pending_since', flush_responses)
@@ -0,0 +1,312 @@
+# app/quiz_session.py
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app, g, session
+from werkzeug.datastructures import CallbackDict
+import json, random, threading, time
+
+
+class MemoryStore:
+    """In-process LRU store. Fast, but per-process and lost on restart.
+
+    Entries that are evicted or expire while holding `keep_marker` are set
+    aside for the next buffered() call instead of being thrown away.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.keep_marker = None
+        self._data = OrderedDict()
+        self._dropped = []
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, saved_at, value = entry
+            if expires_at < time.monotonic():
+                self._drop(key)
+                return None
+            self._data.move_to_end(key)
+            return json.loads(value)
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            now = time.monotonic()
+            self._data[key] = (now + ttl, now, json.dumps(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._drop(next(iter(self._data)))
+
+    def _drop(self, key):
+        value = self._data.pop(key)[2]
+        if self.keep_marker and self.keep_marker in value:
+            self._dropped.append((key, value))
+
+    def buffered(self, marker, ttl):
+        """(key, state, idle seconds, gone) for every state containing `marker`"""
+        with self._lock:
+            now = time.monotonic()
+            found = [(key, value, now - saved_at, expires_at < now)
+                     for key, (expires_at, saved_at, value) in self._data.items() if marker in value]
+            dropped, self._dropped = self._dropped, []
+        return [(key, json.loads(value), idle, gone) for key, value, idle, gone in found] + \
+            [(key, json.loads(value), float('inf'), True) for key, value in dropped]
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class DatabaseStore:
+    """Store backed by the quiz_session table.
+
+    Uses its own connection so saving quiz state never commits unrelated
+    changes pending in the request's ORM session.
+    """
+
+    # Chance that a write also purges expired rows
+    purge_probability = 0.01
+
+    def __init__(self, db):
+        self.db = db
+        self.keep_marker = None
+
+    @property
+    def table(self):
+        from app.models import QuizSession
+        return QuizSession.__table__
+
+    def get(self, key):
+        table = self.table
+        with self.db.engine.connect() as conn:
+            row = conn.execute(
+                table.select().where(table.c.key == key, table.c.expires_at > datetime.utcnow())
+            ).first()
+        return json.loads(row.data) if row else None
+
+    def set(self, key, value, ttl):
+        table = self.table
+        values = {'data': json.dumps(value), 'expires_at': datetime.utcnow() + timedelta(seconds=ttl)}
+        with self.db.engine.begin() as conn:
+            result = conn.execute(table.update().where(table.c.key == key).values(**values))
+            if result.rowcount == 0:
+                conn.execute(table.insert().values(key=key, **values))
+            if random.random() < self.purge_probability:
+                expired = table.c.expires_at <= datetime.utcnow()
+                if self.keep_marker:
+                    # Left for buffered() to hand over first
+                    expired = expired & ~table.c.data.contains(self.keep_marker, autoescape=True)
+                conn.execute(table.delete().where(expired))
+
+    def delete(self, key):
+        table = self.table
+        with self.db.engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.key == key))
+
+    def buffered(self, marker, ttl):
+        """(key, state, idle seconds, gone) for every state containing `marker`"""
+        table = self.table
+        now = datetime.utcnow()
+        with self.db.engine.connect() as conn:
+            rows = conn.execute(
+                table.select().where(table.c.data.contains(marker, autoescape=True))
+            ).all()
+        return [(row.key, json.loads(row.data), ttl - (row.expires_at - now).total_seconds(), row.expires_at <= now)
+                for row in rows]
+
+
+class RedisStore:
+    """Store for any client with the redis-py get/setex/delete interface."""
+
+    def __init__(self, client, prefix='quiz:'):
+        self.client = client
+        self.prefix = prefix
+        self.keep_marker = None
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.setex(self.prefix + key, int(ttl), json.dumps(value))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def buffered(self, marker, ttl):
+        """(key, state, idle seconds, gone) for every state containing `marker`.
+
+        Redis expires keys by itself, so states are only found while alive;
+        sweeping more often than the TTL is what keeps their buffers.
+        """
+        if not hasattr(self.client, 'scan_iter'):
+            return []
+        found = []
+        for name in self.client.scan_iter(match=self.prefix + '*'):
+            value = self.client.get(name)
+            remaining = self.client.ttl(name)
+            if isinstance(value, bytes):
+                value = value.decode()
+            if value is None or marker not in value or remaining < 0:
+                continue
+            name = name.decode() if isinstance(name, bytes) else name
+            found.append((name[len(self.prefix):], json.loads(value), ttl - remaining, False))
+        return found
+
+
+class QuizState(CallbackDict):
+    """Server-side state for one quiz attempt.
+
+    Like Flask's session, only reassigning keys marks the state modified;
+    mutate a copy of a list and assign it back rather than changing it in
+    place.
+    """
+
+    def __init__(self, attempt_id, initial=None):
+        def on_update(self):
+            self.modified = True
+
+        self.attempt_id = attempt_id
+        self.modified = False
+        super().__init__(initial, on_update)
+
+    def set(self, key, value):
+        """Assign a key only if its value changes, so unchanged views don't write the state"""
+        if key not in self or self[key] != value:
+            self[key] = value
+
+
+class QuizSessions:
+    """Keeps quiz progress server-side, keyed by attempt.
+
+    Only the attempt id travels in the signed session cookie. The state
+    itself lives in the backend chosen by ``QUIZ_SESSION_BACKEND``
+    ('database', 'memory' or 'redis') and expires after
+    ``QUIZ_SESSION_TTL`` seconds without activity.
+
+    A state can carry a write buffer (see register_buffer). It is flushed
+    before the state is replaced or ended, and when the state is evicted,
+    expires or sits idle, by a sweep that runs at most every
+    ``RESPONSE_FLUSH_INTERVAL`` seconds while ``RESPONSE_WRITE_BEHIND`` is on.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = 3600
+        self._buffer_key = None
+        self._flush = None
+        self._last_sweep = time.monotonic()
+        self._sweep_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def register_buffer(self, key, flush):
+        """States holding `key` buffer writes that `flush(state)` saves and clears"""
+        self._buffer_key = key
+        self._flush = flush
+        if self.backend is not None:
+            self.backend.keep_marker = json.dumps(key)
+
+    def init_app(self, app):
+        backend = app.config.get('QUIZ_SESSION_BACKEND', 'database')
+        if backend == 'memory':
+            self.backend = MemoryStore(app.config.get('QUIZ_SESSION_MAX_ENTRIES', 10000))
+        elif backend == 'redis':
+            client = app.config.get('QUIZ_SESSION_REDIS_CLIENT')
+            if client is None:
+                import redis
+                client = redis.Redis.from_url(app.config['QUIZ_SESSION_REDIS_URL'])
+            self.backend = RedisStore(client)
+        elif backend == 'database':
+            from app import db
+            self.backend = DatabaseStore(db)
+        else:
+            raise ValueError(f'Unknown QUIZ_SESSION_BACKEND: {backend!r}')
+
+        self.ttl = app.config.get('QUIZ_SESSION_TTL', 3600)
+        if self._buffer_key is not None:
+            self.backend.keep_marker = json.dumps(self._buffer_key)
+        app.after_request(self._save)
+        app.extensions['quiz_sessions'] = self
+
+    @property
+    def current(self):
+        """The state for the attempt in the session cookie, or None"""
+        if 'quiz_state' not in g:
+            attempt_id = session.get('attempt_id')
+            data = self.backend.get(str(attempt_id)) if attempt_id is not None else None
+            g.quiz_state = QuizState(attempt_id, data) if data is not None else None
+        return g.quiz_state
+
+    def start(self, attempt_id, **values):
+        """Begin tracking a new attempt for this browser session"""
+        previous_id = session.get('attempt_id')
+        if previous_id not in (None, attempt_id):
+            # The previous attempt can't be resumed from this browser any more
+            self._flush_buffer(self.current)
+            self.backend.delete(str(previous_id))
+        session['attempt_id'] = attempt_id
+        g.quiz_state = QuizState(attempt_id, values)
+        g.quiz_state.modified = True
+        return g.quiz_state
+
+    def end(self):
+        """Forget the current attempt"""
+        self._flush_buffer(self.current)
+        attempt_id = session.pop('attempt_id', None)
+        if attempt_id is not None:
+            self.backend.delete(str(attempt_id))
+        g.quiz_state = None
+
+    def _flush_buffer(self, state):
+        if state is not None and self._flush is not None and state.get(self._buffer_key):
+            self._flush(state)
+
+    def sweep(self, idle_seconds):
+        """Flush the buffers of states idle for `idle_seconds` or dropped by the backend.
+
+        Returns the number of states flushed.
+        """
+        if self._flush is None:
+            return 0
+        marker = json.dumps(self._buffer_key)
+        flushed = 0
+        for key, data, idle, gone in self.backend.buffered(marker, self.ttl):
+            if idle < idle_seconds:
+                continue
+            state = QuizState(int(key), data)
+            self._flush(state)
+            if gone:
+                self.backend.delete(key)
+            else:
+                self.backend.set(key, dict(state), max(self.ttl - idle, 1))
+            flushed += 1
+        return flushed
+
+    def _save(self, response):
+        state = g.get('quiz_state')
+        if state is not None and state.modified:
+            self.backend.set(str(state.attempt_id), dict(state), self.ttl)
+        self._maybe_sweep()
+        return response
+
+    def _maybe_sweep(self):
+        """Sweep idle buffers from a request at most once per interval, one thread at a time"""
+        config = current_app.config
+        interval = config.get('RESPONSE_FLUSH_INTERVAL', 120)
+        if not config.get('RESPONSE_WRITE_BEHIND') or time.monotonic() - self._last_sweep < interval:
+            return
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_sweep = time.monotonic()
+            self.sweep(interval)
+        except Exception:
+            current_app.logger.exception('Flushing idle quiz buffers failed')
+            from app import db
+            db.session.rollback()
+        finally:
+            self._sweep_lock.release()
@@ -0,0 +1,105 @@
+# app/reports.py
+from app import db, question_bank
+from app.models import QuestionResponse
+from app.response_codec import decode_answer, option_list, unpack_options
+from sqlalchemy import case, func
+import json, random
+
+
+def presented_options(response, question_data, answered_options=None):
+    """Return the exact options that were shown for a response.
+
+    `answered_options` is the option list the response was stored against,
+    option_list(question_data, response.option_set_id) if not given.
+    """
+    correct_answer = question_data['correct_answer']
+    if response.option_order is not None:
+        if answered_options is None:
+            answered_options = option_list(question_data, response.option_set_id)
+        options = unpack_options(answered_options, response.option_order)
+        if options is not None:
+            return options
+    if response.presented_options:
+        try:
+            return json.loads(response.presented_options)
+        except ValueError:
+            pass
+
+    # Fallback for old records without (valid) stored options
+    incorrect_options = [opt for opt in question_data['options'] if opt != correct_answer]
+    options = random.sample(incorrect_options, 3) + [correct_answer]
+    random.shuffle(options)
+    return options
+
+
+def _responses_query(attempt_id, level=None, limit=None):
+    query = QuestionResponse.query.filter(
+        QuestionResponse.attempt_id == attempt_id,
+        QuestionResponse.level.isnot(None)
+    )
+    if level is not None:
+        query = query.filter(QuestionResponse.level == level)
+    query = query.order_by(QuestionResponse.id.asc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def level_totals(attempt_id, level=None, limit=None):
+    """Aggregate an attempt's responses per level with a single GROUP BY.
+
+    Returns a dict mapping level -> {'total_points', 'total_correct',
+    'total_possible_points', 'total_questions'}.
+    """
+    rows = _responses_query(attempt_id, level, limit).subquery()
+    totals = db.session.query(
+        rows.c.level,
+        func.coalesce(func.sum(rows.c.points), 0),
+        func.sum(case((rows.c.is_correct, 1), else_=0)),
+        func.coalesce(func.sum(rows.c.possible_points), 0),
+        func.count()
+    ).group_by(rows.c.level)
+
+    return {
+        level: {
+            'total_points': total_points,
+            'total_correct': total_correct,
+            'total_possible_points': total_possible_points,
+            'total_questions': total_questions
+        }
+        for level, total_points, total_correct, total_possible_points, total_questions in totals
+    }
+
+
+def build_level_reports(attempt_id, level=None, limit=None):
+    """Build the per-level report for an attempt.
+
+    Totals come from level_totals(); the per-question details are built in
+    a single pass over the attempt's responses. Pass level/limit to restrict
+    the report to the first `limit` responses of one level.
+    """
+    levels_data = {
+        level_num: dict(totals, responses=[])
+        for level_num, totals in level_totals(attempt_id, level, limit).items()
+    }
+
+    for response in _responses_query(attempt_id, level, limit):
+        question_data = question_bank.get(response.question_id)
+        if not question_data:
+            continue
+
+        # Positions refer to the options the question had when it was answered
+        answered_options = option_list(question_data, response.option_set_id)
+        user_answer = decode_answer(answered_options, response.answer_index, response.user_answer)
+        levels_data[response.level]['responses'].append({
+            'text': question_data['text'],
+            'options': presented_options(response, question_data, answered_options),
+            'correct_answer': question_data['correct_answer'],
+            'user_answer': user_answer,
+            'is_correct': response.is_correct,
+            'points': response.points,
+            'skipped': user_answer is None,
+            'possible_points': response.possible_points
+        })
+
+    return levels_data
@@ -0,0 +1,164 @@
+# app/response_codec.py
+from app import db, question_bank
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+import hashlib, json, threading
+
+# Responses store the options they showed as positions in an option list, one
+# byte per option (position + 1, so 0 ends the list), packed into an integer:
+# options 2, 0, 3, 1 of a list are stored as 0x02040103. Up to 7 options fit a
+# signed 64-bit column. The chosen answer is stored as a position too.
+#
+# The list is the question's options when it was answered, kept as an
+# OptionSet row whose id the response stores, so later edits to the options
+# don't change what the response decodes to. Rows whose options or answer are
+# not in that list, or that were answered before the list could be recorded,
+# keep the old text columns instead.
+MAX_PACKED_OPTIONS = 7
+
+# Option lists by OptionSet id; rows never change, so entries never go stale
+_option_sets = {}
+_option_sets_lock = threading.Lock()
+OPTION_SET_CACHE_SIZE = 10000
+
+
+def options_digest(options):
+    """Short fingerprint of an option list, identifying it among a question's lists"""
+    data = json.dumps(options, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def _stored_option_sets(conn, questions):
+    """{question id: OptionSet id} of the stored lists that match the questions' current options"""
+    from app.models import OptionSet
+
+    table = OptionSet.__table__
+    digests = {q['id']: options_digest(q['options']) for q in questions}
+    query = select(table.c.id, table.c.question_id, table.c.digest)
+    if len(digests) <= 500:
+        query = query.where(table.c.question_id.in_(list(digests)))
+    return {row.question_id: row.id for row in conn.execute(query)
+            if digests.get(row.question_id) == row.digest}
+
+
+def find_option_sets(questions):
+    """Look up the OptionSet ids of the questions' current options, without storing any"""
+    with db.engine.connect() as conn:
+        return _stored_option_sets(conn, questions)
+
+
+def record_option_sets(questions):
+    """Store the current option lists of the questions, returning {question id: OptionSet id}.
+
+    Uses its own transaction, so the rows are there before any response
+    refers to them and it is safe to call in the middle of a request.
+    """
+    from app.models import OptionSet
+
+    for _ in range(2):
+        try:
+            with db.engine.begin() as conn:
+                ids = _stored_option_sets(conn, questions)
+                missing = [q for q in questions if q['id'] not in ids]
+                if missing:
+                    conn.execute(insert(OptionSet.__table__), [
+                        {'question_id': q['id'], 'digest': options_digest(q['options']),
+                         'options': json.dumps(q['options'], ensure_ascii=False)}
+                        for q in missing
+                    ])
+                    ids.update(_stored_option_sets(conn, missing))
+            return ids
+        except IntegrityError:
+            # Another process recorded some of the same lists first; read them back
+            pass
+    return find_option_sets(questions)
+
+
+def option_list(question, option_set_id):
+    """The option list a response's positions refer to, or None if it is unknown"""
+    if option_set_id is None:
+        # Compacted before option lists were recorded: the question's options at the time
+        return question['options'] if question else None
+    if question and question_bank.option_set_id(question['id']) == option_set_id:
+        return question['options']
+
+    with _option_sets_lock:
+        options = _option_sets.get(option_set_id)
+    if options is None:
+        from app.models import OptionSet
+        row = db.session.get(OptionSet, option_set_id)
+        if row is None:
+            return None
+        options = json.loads(row.options)
+        with _option_sets_lock:
+            if len(_option_sets) >= OPTION_SET_CACHE_SIZE:
+                _option_sets.clear()
+            _option_sets[option_set_id] = options
+    return options
+
+
+def pack_options(option_list, options):
+    """Pack the presented options, or None if one isn't in the option list"""
+    if len(options) > MAX_PACKED_OPTIONS:
+        return None
+    positions = {}
+    for position, option in enumerate(option_list):
+        positions.setdefault(option, position)
+
+    packed = 0
+    for slot, option in enumerate(options):
+        position = positions.get(option)
+        if position is None or position > 254:
+            return None
+        packed |= (position + 1) << (8 * slot)
+    return packed
+
+
+def unpack_options(option_list, packed):
+    """Return the option texts for a packed value, or None if they aren't all in the list"""
+    if option_list is None:
+        return None
+    options = []
+    while packed:
+        position = (packed & 0xFF) - 1
+        if position >= len(option_list):
+            return None
+        options.append(option_list[position])
+        packed >>= 8
+    return options
+
+
+def answer_index(option_list, answer):
+    """Position of an answer in the option list, or None"""
+    if answer is None:
+        return None
+    try:
+        return option_list.index(answer)
+    except ValueError:
+        return None
+
+
+def decode_answer(option_list, index, user_answer):
+    """The answer text of a response, from its answer_index or its user_answer column"""
+    if index is None or option_list is None or not 0 <= index < len(option_list):
+        return user_answer
+    return option_list[index]
+
+
+def encode_response(question, options, answer):
+    """Column values for a response: positions where possible, text otherwise"""
+    option_set_id = question_bank.option_set_id(question['id'], record=True)
+    if option_set_id is None:
+        # The option list couldn't be recorded; text stays readable whatever happens to it
+        return {'option_order': None, 'presented_options': json.dumps(options), 'answer_index': None,
+                'user_answer': answer, 'option_set_id': None}
+
+    option_order = pack_options(question['options'], options)
+    index = answer_index(question['options'], answer)
+    return {
+        'option_order': option_order,
+        'presented_options': json.dumps(options) if option_order is None else None,
+        'answer_index': index,
+        'user_answer': answer if index is None else None,
+        'option_set_id': option_set_id if option_order is not None or index is not None else None,
+    }
@@ -1,8 +1,15 @@
 # app/routes/admin.py
-from flask import Blueprint, render_template, redirect, url_for, flash, abort
+from flask import Blueprint, Response, render_template, url_for, abort, request, current_app, stream_with_context
 from flask_login import login_required, current_user
-from app.models import User, Quiz, QuizAttempt, QuestionResponse
+from app.models import User, UserStats, Quiz, QuizAttempt, QuestionStats, AnalyticsWatermark
+from app.archive import restore_attempt
+from app.analytics import JOB_NAME, time_percentiles, distractor_rates
+from app.dashboard import dashboard_stats
+from app.reports import build_level_reports
+from app.export import FORMATS, export_chunks
 from app import db
+from datetime import datetime
+from sqlalchemy.orm import contains_eager
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -11,24 +18,142 @@ def check_admin():
     if not current_user.is_authenticated or not current_user.is_admin:
         abort(403)
 
+def _page_after(query, id_column, page_size):
+    """Apply keyset pagination on an id column (newest first).
+
+    Returns the page of rows and the cursor for the next page, if any.
+    """
+    before = request.args.get('before', type=int)
+    if before:
+        query = query.filter(id_column < before)
+    rows = query.order_by(id_column.desc()).limit(page_size + 1).all()
+    if len(rows) > page_size:
+        return rows[:page_size], rows[page_size - 1].id
+    return rows, None
+
 @admin_bp.route('/dashboard')
 @login_required
 def dashboard():
-    users = User.query.all()
-    quizzes = Quiz.query.all()
-    attempts = QuizAttempt.query.all()
+    page_size = current_app.config.get('ADMIN_PAGE_SIZE', 50)
+
+    # Filters for both the aggregates and the drill-down list
+    days = request.args.get('days', 30, type=int)
+    days = days if days in (1, 7, 30, 90, 365) else 30
+    topic = request.args.get('topic') or None
+    username = request.args.get('username', '').strip()
+    status = request.args.get('status')
+
+    stats = dashboard_stats(days=days, topic=topic)
+
+    # Attempts in the window, newest first, with quiz and user joined in
+    attempts_query = QuizAttempt.query.join(QuizAttempt.quiz)\
+        .outerjoin(QuizAttempt.user)\
+        .options(contains_eager(QuizAttempt.quiz), contains_eager(QuizAttempt.user))\
+        .filter(QuizAttempt.date_attempted >= stats['since'])
+    if topic:
+        attempts_query = attempts_query.filter(Quiz.topic == topic)
+    if username:
+        attempts_query = attempts_query.filter(User.username == username)
+    if status == 'complete':
+        attempts_query = attempts_query.filter(QuizAttempt.is_complete.is_(True))
+    elif status == 'incomplete':
+        attempts_query = attempts_query.filter(QuizAttempt.is_complete.is_(False))
+
+    attempts, next_cursor = _page_after(attempts_query, QuizAttempt.id, page_size)
+
+    return render_template('admin/dashboard.html',
+                          stats=stats,
+                          attempts=attempts,
+                          next_cursor=next_cursor,
+                          topics=[quiz.topic for quiz in Quiz.query.order_by(Quiz.topic.asc())],
+                          filters={'days': days, 'topic': topic or '', 'username': username, 'status': status or ''})
+
+@admin_bp.route('/dashboard/users')
+@login_required
+def users():
+    page_size = current_app.config.get('ADMIN_PAGE_SIZE', 50)
+    search = request.args.get('q', '').strip()
+
+    users_query = db.session.query(User, UserStats)\
+        .outerjoin(UserStats, UserStats.user_id == User.id)
+    if search:
+        users_query = users_query.filter(User.username.startswith(search))
+
+    before = request.args.get('before', type=int)
+    if before:
+        users_query = users_query.filter(User.id < before)
+    rows = users_query.order_by(User.id.desc()).limit(page_size + 1).all()
+    next_cursor = rows[page_size - 1][0].id if len(rows) > page_size else None
+
+    return render_template('admin/users.html',
+                          rows=rows[:page_size],
+                          next_cursor=next_cursor,
+                          search=search)
+
+@admin_bp.route('/dashboard/questions')
+@login_required
+def questions():
+    topic = request.args.get('topic') or None
+    level = request.args.get('level', type=int)
     
-    return render_template('admin/dashboard.html', 
-                          users=users,
-                          quizzes=quizzes,
-                          attempts=attempts)
+    # Precomputed by `flask analytics update`; hardest questions first
+    stats_query = QuestionStats.query
+    if topic:
+        stats_query = stats_query.filter(QuestionStats.topic == topic)
+    if level:
+        stats_query = stats_query.filter(QuestionStats.level == level)
+    accuracy = QuestionStats.correct * 1.0 / db.func.nullif(QuestionStats.answered, 0)
+    rows = stats_query.order_by(accuracy.asc(), QuestionStats.question_id.asc())\
+        .limit(current_app.config.get('ADMIN_PAGE_SIZE', 50)).all()
+    
+    report = [
+        {'stats': stats, 'timing': timing, 'distractors': distractor_rates(stats)[:3]}
+        for stats, timing in zip(rows, time_percentiles(rows, (50, 90)))
+    ]
+    
+    return render_template('admin/questions.html',
+                          report=report,
+                          topics=[quiz.topic for quiz in Quiz.query.order_by(Quiz.topic.asc())],
+                          watermark=db.session.get(AnalyticsWatermark, JOB_NAME),
+                          filters={'topic': topic or '', 'level': level or ''})
+
+def _date_arg(name):
+    value = request.args.get(name)
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError:
+        abort(400)
+
+@admin_bp.route('/dashboard/export')
+@login_required
+def export():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        abort(400)
+    filters = {
+        'topic': request.args.get('topic') or None,
+        'since': _date_arg('since'),
+        'until': _date_arg('until'),
+        'username': request.args.get('username', '').strip() or None,
+    }
+    
+    # Rows are encoded as they come off the cursor; nothing is held in memory
+    filename = 'attempts-{}.{}'.format(datetime.utcnow().strftime('%Y%m%d-%H%M%S'), FORMATS[fmt][2])
+    return Response(stream_with_context(export_chunks(fmt, **filters)),
+                    mimetype=FORMATS[fmt][1],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
 
 @admin_bp.route('/view_attempt/<int:attempt_id>')
 @login_required
 def view_attempt(attempt_id):
-    attempt = QuizAttempt.query.get_or_404(attempt_id)
-    responses = QuestionResponse.query.filter_by(attempt_id=attempt_id).all()
-    
-    return render_template('admin/view_attempt.html',
+    attempt = db.session.get(QuizAttempt, attempt_id) or restore_attempt(attempt_id)
+    if attempt is None:
+        abort(404)
+    levels_data = build_level_reports(attempt_id)
+
+    return render_template('auth/attempt_details.html',
                           attempt=attempt,
-                          responses=responses)
\ No newline at end of file
+                          levels_data=sorted(levels_data.items()),
+                          quiz=Quiz.query.get(attempt.quiz_id),
+                          back_url=url_for('admin.dashboard'),
+                          back_label='Back to Dashboard')
@@ -0,0 +1,100 @@
+# app/routes/api.py
+from flask import Blueprint, jsonify, request, url_for
+from app import quiz_sessions
+from app.quiz_flow import QUESTIONS_PER_LEVEL, question_at, answer_question, complete_level
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/quiz')
+
+# JSON version of the question flow, so the page can prefetch question N+1
+# while question N is on screen and submit answers without a redirect.
+
+
+def _error(message, status):
+    return jsonify({'error': message, 'redirect': url_for('main.topics')}), status
+
+
+@api_bp.route('/question/<int:index>')
+def question(index):
+    state = quiz_sessions.current
+    if state is None:
+        return _error('No quiz in progress', 404)
+
+    # Only the current question and the one after it can be fetched
+    answered = state.get('questions_answered', 0)
+    if index not in (answered, answered + 1):
+        return _error('Question is not available', 409)
+
+    question, options = question_at(state, index)
+    if question is None:
+        return jsonify({'level_complete': True, 'level_complete_url': url_for('main.level_complete')}), 404
+
+    return jsonify({
+        'index': index,
+        'question_id': question['id'],
+        'text': question['text'],
+        'options': options,
+        'level': state.get('level', 1),
+        'question_num': index + 1,
+        'total_questions': QUESTIONS_PER_LEVEL,
+        'timer': 30,
+    })
+
+
+def _record(skipped):
+    state = quiz_sessions.current
+    if state is None:
+        return _error('No quiz in progress', 404)
+
+    data = request.get_json(silent=True) or {}
+    index = state.get('questions_answered', 0)
+    question, options = question_at(state, index)
+
+    # The client names the question it answered so a stale tab can't answer the wrong one
+    if question is None or data.get('question_id') != question['id']:
+        return _error('Question is not the current one', 409)
+
+    try:
+        time_taken = int(data.get('time_taken', 30))
+    except (TypeError, ValueError):
+        time_taken = 30
+
+    is_correct, points = answer_question(state, question, options, data.get('answer') or None,
+                                         time_taken, skipped=skipped)
+
+    level_done = state['questions_answered'] >= QUESTIONS_PER_LEVEL
+    return jsonify({
+        'is_correct': is_correct,
+        'points': points,
+        'score': state.get('score', 0),
+        'questions_answered': state['questions_answered'],
+        'level_complete': level_done,
+        'level_complete_url': url_for('main.level_complete') if level_done else None,
+    })
+
+
+@api_bp.route('/answer', methods=['POST'])
+def answer():
+    return _record(skipped=False)
+
+
+@api_bp.route('/skip', methods=['POST'])
+def skip():
+    return _record(skipped=True)
+
+
+@api_bp.route('/level_summary')
+def level_summary():
+    state = quiz_sessions.current
+    if state is None:
+        return _error('No quiz in progress', 404)
+    if state.get('questions_answered', 0) < QUESTIONS_PER_LEVEL:
+        return _error('Level is not finished', 409)
+
+    summary = complete_level(state)
+    if summary['quiz_complete']:
+        summary['next_url'] = url_for('main.quiz_complete')
+    elif summary['next_level']:
+        summary['next_url'] = url_for('main.next_level', level=summary['next_level'])
+    else:
+        summary['next_url'] = url_for('main.topics')
+    return jsonify(summary)
@@ -1,8 +1,14 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, abort
 from flask_login import login_user, logout_user, login_required, current_user
-from app.models import User, Quiz, QuizAttempt, QuestionResponse
-from app import db
-import random, json 
+from app.models import User, UserStats, Quiz, QuizAttempt, ArchivedAttempt
+from app import db, login_limiter
+from app.archive import restore_attempt
+from app.security import HashingBusy
+from app.reports import build_level_reports
+from app.user_stats import get_user_stats
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import contains_eager
+from datetime import datetime
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -15,9 +21,24 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
         
+        # Throttle guessing per client and per account
+        if not login_limiter.allow('ip:%s' % request.remote_addr, 'user:%s' % (username or '').lower()):
+            flash('Too many login attempts. Please wait a minute and try again.')
+            return render_template('auth/login.html'), 429
+        
         user = User.query.filter_by(username=username).first()
         
-        if user and user.check_password(password):
+        try:
+            valid = user is not None and user.check_password(password)
+            if valid and user.password_needs_rehash():
+                # Hashing settings changed since this password was set
+                user.set_password(password)
+                db.session.commit()
+        except HashingBusy:
+            flash('The server is busy. Please try again in a moment.')
+            return render_template('auth/login.html'), 503
+        
+        if valid:
             login_user(user, remember=True)
             next_page = request.args.get('next')
             return redirect(next_page or url_for('main.index'))
@@ -36,6 +57,10 @@ def register():
         email = request.form.get('email')
         password = request.form.get('password')
         
+        if not login_limiter.allow('ip:%s' % request.remote_addr):
+            flash('Too many attempts. Please wait a minute and try again.')
+            return render_template('auth/register.html'), 429
+        
         # Check if username or email exists
         if User.query.filter_by(username=username).first():
             flash('Username already exists')
@@ -47,13 +72,19 @@ def register():
         
         # Create new user
         user = User(username=username, email=email)
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except HashingBusy:
+            flash('The server is busy. Please try again in a moment.')
+            return render_template('auth/register.html'), 503
         
         # Make first user an admin (for demo purposes)
         if User.query.count() == 0:
             user.is_admin = True
         
         db.session.add(user)
+        db.session.flush()
+        db.session.add(UserStats(user_id=user.id, attempts=0, completed=0))
         db.session.commit()
         
         # Auto-login the user after registration
@@ -74,82 +105,75 @@ def logout():
 @auth_bp.route('/profile')
 @login_required
 def profile():
-    # Get all quiz attempts for the current user, ordered by most recent
-    attempts = QuizAttempt.query.filter_by(user_id=current_user.id)\
-        .order_by(QuizAttempt.date_attempted.desc()).all()
+    page_size = current_app.config.get('PROFILE_PAGE_SIZE', 20)
+    
+    # Load the running totals first; computing them for older accounts commits
+    stats = get_user_stats(current_user.id)
+    
+    # Get one page of quiz attempts, most recent first, merged with the ones
+    # `db archive-attempts` moved out (opening one of those restores it)
+    cursor = _parse_cursor(request.args.get('before'))
+    attempts = _history_page(QuizAttempt, cursor, page_size + 1) + \
+        _history_page(ArchivedAttempt, cursor, page_size + 1)
+    attempts.sort(key=lambda attempt: (attempt.date_attempted, attempt.id), reverse=True)
+    
+    # The extra row only tells us whether there is an older page
+    next_cursor = None
+    if len(attempts) > page_size:
+        attempts = attempts[:page_size]
+        last = attempts[-1]
+        next_cursor = f'{last.date_attempted.isoformat()}_{last.id}'
+    
+    return render_template('auth/profile.html',
+                          attempts=attempts,
+                          stats=stats,
+                          next_cursor=next_cursor,
+                          is_first_page=cursor is None)
+
+
+def _history_page(model, cursor, limit):
+    """The current user's attempts from `model` before the cursor, most recent first, with their quiz joined in"""
+    query = model.query.join(model.quiz)\
+        .options(contains_eager(model.quiz))\
+        .filter(model.user_id == current_user.id)
     
-    return render_template('auth/profile.html', attempts=attempts)
+    # Keyset pagination: continue after the (date, id) of the last attempt shown
+    if cursor:
+        before_date, before_id = cursor
+        query = query.filter(or_(
+            model.date_attempted < before_date,
+            and_(model.date_attempted == before_date, model.id < before_id)
+        ))
+    
+    return query.order_by(model.date_attempted.desc(), model.id.desc()).limit(limit).all()
+
+
+def _parse_cursor(value):
+    """Split a '<iso date>_<id>' profile cursor, or return None if invalid"""
+    if not value:
+        return None
+    try:
+        date_part, id_part = value.rsplit('_', 1)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except ValueError:
+        return None
 
 
 @auth_bp.route('/attempt_details/<int:attempt_id>')
 @login_required
 def attempt_details(attempt_id):
     # Get the attempt and verify it belongs to current user
-    attempt = QuizAttempt.query.get_or_404(attempt_id)
+    attempt = db.session.get(QuizAttempt, attempt_id) or restore_attempt(attempt_id, user_id=current_user.id)
+    if attempt is None:
+        abort(404)
     
     # Security check - make sure this attempt belongs to the current user
     if attempt.user_id != current_user.id:
         flash('You are not authorized to view this attempt')
         return redirect(url_for('auth.profile'))
     
-    # Get all responses for this attempt
-    responses = QuestionResponse.query.filter_by(attempt_id=attempt_id)\
-        .order_by(QuestionResponse.id.asc()).all()
-    
-    # Load questions from JSON
-    with open('questions.json', 'r', encoding='utf-8') as f:
-        all_questions = json.load(f)
-    
-     # Organize responses by level
-    levels_data = {}
-    for response in responses:
-        # Find the question
-        question_data = next((q for q in all_questions if q['id'] == response.question_id), None)
-        if question_data:
-            level = question_data['level']
-            
-            # Initialize level data if not exists
-            if level not in levels_data:
-                levels_data[level] = {
-                    'responses': [],
-                    'total_points': 0,
-                    'total_correct': 0,
-                    'total_possible_points': 0
-                }
-            
-            # Use the exact options that were presented to the user
-            correct_answer = question_data['correct_answer']
-            if response.presented_options:
-                try:
-                    options = json.loads(response.presented_options)
-                except:
-                    # Fallback if there's an issue with the stored options
-                    incorrect_options = [opt for opt in question_data['options'] if opt != correct_answer]
-                    options = random.sample(incorrect_options, 3) + [correct_answer]
-                    random.shuffle(options)
-            else:
-                # Fallback for old records without stored options
-                incorrect_options = [opt for opt in question_data['options'] if opt != correct_answer]
-                options = random.sample(incorrect_options, 3) + [correct_answer]
-                random.shuffle(options)
-            
-            # Add response to level data
-            levels_data[level]['responses'].append({
-                'text': question_data['text'],
-                'options': options,
-                'correct_answer': correct_answer,
-                'user_answer': response.user_answer,
-                'is_correct': response.is_correct,
-                'points': response.points,
-                'skipped': response.user_answer is None,
-                'possible_points': question_data['points']
-            })
-            
-            # Update level statistics
-            levels_data[level]['total_points'] += response.points
-            if response.is_correct:
-                levels_data[level]['total_correct'] += 1
-            levels_data[level]['total_possible_points'] += question_data['points']
+    # Organize responses by level, with totals aggregated in SQL
+    levels_data = build_level_reports(attempt_id)
     
     # Sort levels
     sorted_levels = sorted(levels_data.items())
@@ -1,20 +1,48 @@
 
-from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from flask_login import current_user
-from app.models import Quiz, QuizAttempt, QuestionResponse
-from app import db
-import json, random, time
+from sqlalchemy.exc import IntegrityError
+from app.models import Quiz, QuizAttempt
+from app import db, question_bank, quiz_sessions, page_cache
+from app.quiz_flow import (QUESTIONS_PER_LEVEL, load_level_questions, question_at, answer_question,
+                           complete_level)
+from app.user_stats import record_attempt_started
+from app.leaderboard import PERIODS, top_entries, user_rank
+import time
 
 main_bp = Blueprint('main', __name__)
 
+TOPICS = ['Science', 'Technology', 'History']
+
 @main_bp.route('/')
+@page_cache.cached
 def index():
     return render_template('quiz/index.html')
 
 @main_bp.route('/topics')
+@page_cache.cached
 def topics():
-    topics = ['Science', 'Technology', 'History']
-    return render_template('quiz/topics.html', topics=topics)
+    return render_template('quiz/topics.html', topics=TOPICS)
+
+@main_bp.route('/leaderboard')
+@main_bp.route('/leaderboard/<topic>')
+def leaderboard(topic=None):
+    topic = topic if topic in TOPICS else TOPICS[0]
+    period = request.args.get('period', 'weekly')
+    if period not in PERIODS:
+        period = 'weekly'
+    
+    # Top N comes from the in-process cache; the user's own rank is one indexed count
+    entries = top_entries(topic, period)
+    my_rank = user_rank(topic, period, current_user.id) if current_user.is_authenticated else None
+    
+    return render_template('quiz/leaderboard.html',
+                          topic=topic,
+                          topics=TOPICS,
+                          period=period,
+                          periods=PERIODS,
+                          entries=entries,
+                          my_rank=my_rank)
 
 @main_bp.route('/start_quiz/<topic>')
 def start_quiz(topic):
@@ -23,209 +51,137 @@ def start_quiz(topic):
     if not quiz:
         quiz = Quiz(topic=topic)
         db.session.add(quiz)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another request created this topic's quiz first
+            db.session.rollback()
+            quiz = Quiz.query.filter_by(topic=topic).first()
     
     # Create attempt
     attempt = QuizAttempt(quiz_id=quiz.id)
     if current_user.is_authenticated:
         attempt.user_id = current_user.id
+        record_attempt_started(current_user.id)
     
     db.session.add(attempt)
     db.session.commit()
     
-    # Store attempt ID in session
-    session['attempt_id'] = attempt.id
-    session['level'] = 1
-    session['score'] = 0
-    session['questions_answered'] = 0
-    session['level_questions'] = []  # Will store the IDs of questions for current level
+    # Store attempt ID in the session cookie and the quiz state server-side
+    # The user id lets question selection skip questions this player has already seen
+    user_id = current_user.id if current_user.is_authenticated else None
+    state = quiz_sessions.start(attempt.id, user_id=user_id, level=1, score=0, questions_answered=0,
+                                level_questions=[])  # Will store the IDs of questions for current level
     
-    # Load questions for the first level
-    _load_level_questions(topic, 1)
+    # Load questions (and their shuffled options) for the first level
+    load_level_questions(state, topic, 1)
     
     return redirect(url_for('main.question'))
 
-def _load_level_questions(topic, level):
-    """Helper function to load 10 random questions for a level"""
-    # Load all questions from JSON
-    with open('questions.json', 'r', encoding='utf-8') as f:
-        all_questions = json.load(f)
-    
-    # Filter questions by topic and level
-    level_questions = [q for q in all_questions if q['topic'] == topic and q['level'] == level]
-    
-    # Select 10 random questions (or all if less than 10)
-    if len(level_questions) > 10:
-        level_questions = random.sample(level_questions, 10)
-    
-    # Store question IDs in session
-    session['level_questions'] = [q['id'] for q in level_questions]
-    session['questions_answered'] = 0
+
+def _quiz_reset_redirect():
+    flash('Your quiz session was reset. Please start a new quiz.')
+    return redirect(url_for('main.topics'))
 
 
 @main_bp.route('/question')
 def question():
-    # Check if the attempt_id exists in the session
-    if 'attempt_id' not in session:
-        flash('Your quiz session was reset. Please start a new quiz.')
-        return redirect(url_for('main.topics'))
+    # Check if there is a quiz in progress for this session
+    state = quiz_sessions.current
+    if state is None:
+        return _quiz_reset_redirect()
 
     # Check if we've reached the question limit for this level
-    if session.get('questions_answered', 0) >= 10:
+    if state.get('questions_answered', 0) >= 10:
         return redirect(url_for('main.level_complete'))
     
-    # Add refresh detection
-    if 'last_question_time' in session:
-        # Calculate time since last question
-        last_time = session.get('last_question_time', 0)
-        current_time = time.time()
-        # If less than 5 seconds have passed since showing the same question
-        # and we're not on the first question of the level
-        if (current_time - last_time < 5 and 
-            session.get('questions_answered', 0) > 0 and
-            session.get('current_question') == session['level_questions'][session.get('questions_answered', 0)]):
-            # This is likely a refresh, redirect to topics
-            flash('Page refresh detected. Your quiz has been reset.')
-            session.pop('attempt_id', None)
-            return redirect(url_for('main.topics'))
-    
-    # Update last question time
-    session['last_question_time'] = time.time()
-    
     # Check if we have questions loaded for this level
-    if not session.get('level_questions'):
-        topic = Quiz.query.get(QuizAttempt.query.get(session['attempt_id']).quiz_id).topic
-        _load_level_questions(topic, session.get('level', 1))
-    
-    # Get next question ID from the loaded questions
-    question_id = session['level_questions'][session.get('questions_answered', 0)]
-    
-    # Load questions from JSON
-    with open('questions.json', 'r', encoding='utf-8') as f:
-        all_questions = json.load(f)
-    
-    # Find the current question
-    question = next((q for q in all_questions if q['id'] == question_id), None)
+    if not state.get('level_questions'):
+        topic = Quiz.query.get(QuizAttempt.query.get(state.attempt_id).quiz_id).topic
+        load_level_questions(state, topic, state.get('level', 1))
     
+    # Get the next question and the options prepared for it
+    question, options = question_at(state, state.get('questions_answered', 0))
     if not question:
         return redirect(url_for('main.level_complete'))
     
-    # Select the correct answer and 3 random incorrect options
-    correct_answer = question['correct_answer']
-    incorrect_options = [opt for opt in question['options'] if opt != correct_answer]
-    selected_options = random.sample(incorrect_options, 3) + [correct_answer]
-    random.shuffle(selected_options)  # Shuffle to randomize position
+    # Add refresh detection. The question last shown and when travel in the
+    # signed cookie, so showing a question doesn't write the quiz state
+    shown = session.get('question_shown')
+    current_time = time.time()
+    # If less than 5 seconds have passed since showing the same question
+    # and we're not on the first question of the level
+    if (shown and shown[0] == question['id'] and current_time - shown[1] < 5 and
+            state.get('questions_answered', 0) > 0):
+        # This is likely a refresh, redirect to topics
+        flash('Page refresh detected. Your quiz has been reset.')
+        quiz_sessions.end()
+        return redirect(url_for('main.topics'))
+    session['question_shown'] = [question['id'], current_time]
     
-    # Store current question and selected options in session
-    session['current_question'] = question['id']
-    session['current_options'] = selected_options
+    # Normally set already by the answer or level load that led here
+    state.set('current_question', question['id'])
+    state.set('current_options', options)
     
     return render_template('quiz/question.html', 
+                          question_id=question['id'],
+                          question_index=state.get('questions_answered', 0),
                           question=question['text'], 
-                          options=selected_options,
-                          level=session.get('level', 1),
-                          question_num=session.get('questions_answered', 0) + 1,
-                          total_questions=10,
+                          options=options,
+                          level=state.get('level', 1),
+                          question_num=state.get('questions_answered', 0) + 1,
+                          total_questions=QUESTIONS_PER_LEVEL,
                           timer=30)
 
 
+def _shown_question(state, question_id):
+    """(question, options) of the current question if `question_id` names it, else (None, None)"""
+    question, options = question_at(state, state.get('questions_answered', 0))
+    if question is None or question_id != question['id']:
+        return None, None
+    return question, options
+
+
 @main_bp.route('/submit_answer', methods=['POST'])
 def submit_answer():
+    state = quiz_sessions.current
+    if state is None:
+        return _quiz_reset_redirect()
+    
+    # The form names the question it answers, so a resubmitted or stale page can't answer another
+    question, options = _shown_question(state, request.form.get('question_id'))
+    if question is None:
+        return redirect(url_for('main.question'))
+    
     # Get data from form
     answer = request.form.get('answer')
     time_taken = int(request.form.get('time_taken', 30))
-    question_id = session.get('current_question')
-    
-    # Load questions from JSON
-    with open('questions.json', 'r', encoding='utf-8') as f:
-        all_questions = json.load(f)
-    
-    # Find the current question
-    question = next((q for q in all_questions if q['id'] == question_id), None)
-    
-    # Check if the question was answered (not skipped or timed out)
-    timed_out = time_taken >= 30
-    
-    # Calculate points
-    is_correct = answer == question['correct_answer'] if answer else False
-    
-    # Determine points: 
-    # - If correct: award full points
-    # - If skipped or timed out: 0 points
-    # - If wrong answer (actively selected incorrect): negative marking
-    if is_correct:
-        points = question['points']
-    elif not answer or timed_out:  # Skipped or timed out
-        points = 0
-    else:  # Wrong answer
-        points = -question['points'] // 2  # Negative marking
-    
-    # Get the options that were presented to the user
-    presented_options = session.get('current_options', [])
-    
-    # Save response with presented options
-    response = QuestionResponse(
-        attempt_id=session['attempt_id'],
-        question_id=question_id,
-        user_answer=answer,
-        is_correct=is_correct,
-        time_taken=time_taken,
-        points=points,
-        presented_options=json.dumps(presented_options)  # Store as JSON string
-    )
-    db.session.add(response)
-    
-    # Update attempt score
-    attempt = QuizAttempt.query.get(session['attempt_id'])
-    attempt.score += points
-    session['score'] = attempt.score
     
-    # Increment questions answered counter
-    session['questions_answered'] = session.get('questions_answered', 0) + 1
-    
-    db.session.commit()
+    # Score and save the answer against the question and options that were shown
+    answer_question(state, question, options, answer, time_taken)
     
     # Check if level is complete
-    if session.get('questions_answered', 0) >= 10:
+    if state.get('questions_answered', 0) >= QUESTIONS_PER_LEVEL:
         return redirect(url_for('main.level_complete'))
     
     return redirect(url_for('main.question'))
 
 
-
 @main_bp.route('/skip_question')
 def skip_question():
-    question_id = session.get('current_question')
+    state = quiz_sessions.current
+    if state is None:
+        return _quiz_reset_redirect()
     
-    # Load questions from JSON to get the question details
-    with open('questions.json', 'r', encoding='utf-8') as f:
-        all_questions = json.load(f)
-    
-    # Find the current question
-    question = next((q for q in all_questions if q['id'] == question_id), None)
-    
-    # Get the options that were presented to the user
-    presented_options = session.get('current_options', [])
+    question, options = _shown_question(state, request.args.get('question_id'))
+    if question is None:
+        return redirect(url_for('main.question'))
     
     # Record the skipped question with 0 points
-    response = QuestionResponse(
-        attempt_id=session['attempt_id'],
-        question_id=question_id,
-        user_answer=None,  # No answer provided
-        is_correct=False,  # Automatically marked as incorrect
-        time_taken=0,      # No time recorded
-        points=0,          # 0 points for skipping
-        presented_options=json.dumps(presented_options)  # Store as JSON string
-    )
-    db.session.add(response)
-    
-    # Increment questions answered counter
-    session['questions_answered'] = session.get('questions_answered', 0) + 1
-    
-    db.session.commit()
+    answer_question(state, question, options, None, 0, skipped=True)
     
     # Check if level is complete
-    if session.get('questions_answered', 0) >= 10:
+    if state.get('questions_answered', 0) >= QUESTIONS_PER_LEVEL:
         return redirect(url_for('main.level_complete'))
     
     return redirect(url_for('main.question'))
@@ -233,143 +189,48 @@ def skip_question():
 
 @main_bp.route('/level_complete')
 def level_complete():
-    attempt = QuizAttempt.query.get(session['attempt_id'])
-    current_level = session.get('level', 1)
-    
-    # Load all questions from JSON
-    with open('questions.json', 'r', encoding='utf-8') as f:
-        all_questions = json.load(f)
-    
-    # Get all responses for this attempt
-    all_responses = QuestionResponse.query.filter_by(
-        attempt_id=attempt.id
-    ).order_by(QuestionResponse.id.asc()).all()
-    
-    # Filter responses for the current level
-    level_responses = []
-    for response in all_responses:
-        # Find the question to get its level
-        question = next((q for q in all_questions if q['id'] == response.question_id), None)
-        if question and question['level'] == current_level:
-            level_responses.append(response)
-    
-    # Limit to the first 10 responses for this level
-    level_responses = level_responses[:10]
+    state = quiz_sessions.current
+    if state is None:
+        return _quiz_reset_redirect()
     
-    # Filter questions for the current level
-    level_questions = [q for q in all_questions if q['level'] == current_level]
-
-    # Get points from the first question of this level (if available)
-    question_points = level_questions[0]['points'] if level_questions else 10
-
-    # Calculate total possible points (10 questions per level)
-    total_possible_points = 10 * question_points
-
-    # Prepare detailed question data
-    questions_detail = []
-    for response in level_responses:
-        # Find the question details from JSON
-        question_data = next((q for q in all_questions if q['id'] == response.question_id), None)
-        if question_data:
-            # Get the correct answer
-            correct_answer = question_data['correct_answer']
-            
-            # Use the exact options that were presented to the user
-            if response.presented_options:
-                try:
-                    options = json.loads(response.presented_options)
-                except:
-                    # Fallback if there's an issue with the stored options
-                    incorrect_options = [opt for opt in question_data['options'] if opt != correct_answer]
-                    options = random.sample(incorrect_options, 3) + [correct_answer]
-                    random.shuffle(options)
-            else:
-                # Fallback for old records without stored options
-                incorrect_options = [opt for opt in question_data['options'] if opt != correct_answer]
-                options = random.sample(incorrect_options, 3) + [correct_answer]
-                random.shuffle(options)
-            
-            questions_detail.append({
-                'text': question_data['text'],
-                'options': options,
-                'correct_answer': correct_answer,
-                'user_answer': response.user_answer,
-                'is_correct': response.is_correct,
-                'points': response.points,
-                'skipped': response.user_answer is None
-            })
-    
-    # Calculate level statistics
-    total_correct = sum(1 for r in level_responses if r.is_correct)
-    total_questions = len(level_responses)
-    percentage_correct = (total_correct / total_questions) * 100 if total_questions > 0 else 0
-    
-    # Calculate score (ensure it's not negative)
-    level_score = sum(r.points for r in level_responses)
-    display_score = max(0, level_score)  # Display score is never negative
-    
-    # Calculate percentage of points obtained
-    percentage_points = (display_score / total_possible_points) * 100 if total_possible_points > 0 else 0
-    
-    # Check if user passed level (60% of total possible points)
-    passed = percentage_points >= 60
-    
-    if passed and current_level < 4:
-        # Update level reached
-        attempt.level_reached = current_level + 1
-        db.session.commit()
-        
-        # Prepare for next level
-        next_level = current_level + 1
-        
-        return render_template('quiz/level_complete.html', 
-                              passed=True, 
-                              level=current_level,
-                              score=display_score,
-                              total_correct=total_correct,
-                              total_questions=total_questions,
-                              percentage_correct=percentage_correct,
-                              percentage_points=percentage_points,
-                              total_possible_points=total_possible_points,
-                              next_level=next_level,
-                              questions_detail=questions_detail)
-    elif passed and current_level == 4:
-        # Completed the quiz
-        attempt.is_complete = True
-        db.session.commit()
+    # Score the level; passing level 4 finishes the quiz
+    summary = complete_level(state)
+    if summary['quiz_complete']:
         return redirect(url_for('main.quiz_complete'))
-    else:
-        # Failed the level
-        attempt.is_complete = True
-        db.session.commit()
-        return render_template('quiz/level_complete.html', 
-                              passed=False, 
-                              level=current_level,
-                              score=display_score,
-                              total_correct=total_correct,
-                              total_questions=total_questions,
-                              percentage_correct=percentage_correct,
-                              percentage_points=percentage_points,
-                              total_possible_points=total_possible_points,
-                              questions_detail=questions_detail)
+    
+    return render_template('quiz/level_complete.html', **summary)
 
 @main_bp.route('/next_level/<int:level>')
 def next_level(level):
-    # Update session with new level
-    session['level'] = level
-    session['questions_answered'] = 0
-    session['level_questions'] = []
+    state = quiz_sessions.current
+    if state is None:
+        return _quiz_reset_redirect()
+    
+    # Only the level after the one just passed can be started; passing it is
+    # what complete_level() records in level_reached
+    attempt = QuizAttempt.query.get(state.attempt_id)
+    if attempt.is_complete or level != state.get('level', 1) + 1 or attempt.level_reached != level:
+        return redirect(url_for('main.question'))
+    
+    # Update quiz state with new level
+    state['level'] = level
+    state['questions_answered'] = 0
+    state['level_questions'] = []
     
     # Load questions for the new level
-    topic = Quiz.query.get(QuizAttempt.query.get(session['attempt_id']).quiz_id).topic
-    _load_level_questions(topic, level)
+    topic = Quiz.query.get(attempt.quiz_id).topic
+    load_level_questions(state, topic, level)
     
     return redirect(url_for('main.question'))
 
 
 @main_bp.route('/quiz_complete')
 def quiz_complete():
-    attempt = QuizAttempt.query.get(session['attempt_id'])
+    state = quiz_sessions.current
+    if state is None:
+        return _quiz_reset_redirect()
+    
+    attempt = QuizAttempt.query.get(state.attempt_id)
     attempt.level_reached = 5
     quiz = Quiz.query.get(attempt.quiz_id)
     
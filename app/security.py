@@ -0,0 +1,120 @@
+# app/security.py
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+import threading, time
+
+
+class HashingBusy(Exception):
+    """Raised when every password hashing slot is taken"""
+
+
+class PasswordHasher:
+    """Runs password hashing on a small, bounded thread pool.
+
+    At most ``PASSWORD_HASH_WORKERS`` hashes run at once and at most
+    ``PASSWORD_HASH_QUEUE`` more wait for a worker; beyond that HashingBusy
+    is raised straight away, so a burst of logins can't take every request
+    thread and CPU core from quiz traffic. Each of those hashes holds its
+    request thread, so together they are kept below ``REQUEST_THREADS``;
+    left unset, each is a quarter of it. ``PASSWORD_HASH_METHOD`` sets the
+    algorithm and cost; hashes made with other settings are reported by
+    needs_rehash() so they can be upgraded at the next login.
+    ``PASSWORD_HASH_WORKERS = 0`` hashes inline on the request thread.
+    """
+
+    def __init__(self, app=None):
+        self.method = 'scrypt:32768:8:1'
+        self.workers = 2
+        self.queue = 2
+        self._executor = None
+        self._slots = None
+        self._prefix = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        threads = app.config.get('REQUEST_THREADS', 8)
+        workers = app.config.get('PASSWORD_HASH_WORKERS')
+        queue = app.config.get('PASSWORD_HASH_QUEUE')
+        self.workers = min(max(1, threads // 4) if workers is None else workers, threads - 1)
+        self.queue = min(threads // 4 if queue is None else queue, max(0, threads - 1 - self.workers))
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = None
+            self._slots = threading.BoundedSemaphore(self.workers + self.queue) if self.workers else None
+            self._prefix = None
+        app.extensions['password_hasher'] = self
+
+    def _run(self, fn, *args):
+        if not self._slots:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix='password-hash')
+                executor = self._executor
+            return executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with a different method or cost"""
+        if self._prefix is None:
+            # Werkzeug fills in defaults (e.g. pbkdf2 iterations), so compare against a real hash
+            self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._prefix
+
+
+class RateLimiter:
+    """In-memory token buckets, one per key, for throttling login attempts.
+
+    Each key may make ``LOGIN_BURST`` attempts in a row and regains
+    ``LOGIN_RATE_PER_MINUTE`` attempts per minute. Buckets live in this
+    process only and the least recently used are dropped past max_keys.
+    """
+
+    def __init__(self, app=None, max_keys=10000):
+        self.rate = 10 / 60.0
+        self.burst = 5
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.rate = app.config.get('LOGIN_RATE_PER_MINUTE', 10) / 60.0
+        self.burst = app.config.get('LOGIN_BURST', 5)
+        with self._lock:
+            self._buckets.clear()
+        app.extensions['login_limiter'] = self
+
+    def allow(self, *keys):
+        """Take one token from each key's bucket, or none if any of them is empty"""
+        now = time.monotonic()
+        with self._lock:
+            levels = {}
+            for key in keys:
+                tokens, updated = self._buckets.get(key, (self.burst, now))
+                levels[key] = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = all(tokens >= 1 for tokens in levels.values())
+
+            for key, tokens in levels.items():
+                self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed
@@ -0,0 +1,118 @@
+# app/seen_questions.py
+from app import db, question_bank
+from app.models import QuestionSlot, SeenQuestions
+from sqlalchemy import insert, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+
+# Attempts at setting bits before giving up on a row other requests keep changing
+MARK_SEEN_RETRIES = 5
+
+
+def _to_int(mask):
+    return int.from_bytes(mask or b'', 'little')
+
+
+def _to_bytes(mask):
+    return mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+
+
+def _stored_slots(conn, pools=None):
+    """{(topic, level, question id): slot} of every stored slot, or those of some pools"""
+    table = QuestionSlot.__table__
+    query = select(table.c.topic, table.c.level, table.c.question_id, table.c.slot)
+    if pools is not None:
+        query = query.where(tuple_(table.c.topic, table.c.level).in_(list(pools)))
+    return {(row.topic, row.level, row.question_id): row.slot for row in conn.execute(query)}
+
+
+def find_question_slots():
+    """Read every question slot, without handing out any"""
+    with db.engine.connect() as conn:
+        return _stored_slots(conn)
+
+
+def record_question_slots(pools):
+    """Give the questions of `pools` ({(topic, level): questions}) that have no slot one.
+
+    New slots follow the existing ones of their pool in pool order. Uses its
+    own transaction, like response_codec.record_option_sets(). Returns all
+    slots of those pools.
+    """
+    table = QuestionSlot.__table__
+    for _ in range(2):
+        try:
+            with db.engine.begin() as conn:
+                slots = _stored_slots(conn, pools)
+                rows = []
+                for (topic, level), questions in pools.items():
+                    taken = [slot for (t, l, qid), slot in slots.items() if (t, l) == (topic, level)]
+                    next_slot = max(taken, default=-1) + 1
+                    for q in questions:
+                        if (topic, level, q['id']) not in slots:
+                            rows.append({'topic': topic, 'level': level, 'question_id': q['id'], 'slot': next_slot})
+                            next_slot += 1
+                if rows:
+                    conn.execute(insert(table), rows)
+                    slots.update(((r['topic'], r['level'], r['question_id']), r['slot']) for r in rows)
+            return slots
+        except IntegrityError:
+            # Another process handed out slots in the same pools first; start over from theirs
+            pass
+    with db.engine.connect() as conn:
+        return _stored_slots(conn, pools)
+
+
+def choose_questions(user_id, topic, level, k):
+    """Pick k questions of a level the user hasn't been asked yet.
+
+    Once every question of the level has been asked the user's bitmap is
+    cleared and the pool starts over.
+    """
+    row = db.session.get(SeenQuestions, (user_id, topic, level))
+    seen = _to_int(row.mask) if row else 0
+    questions, remaining = question_bank.sample_unseen(topic, level, k, seen)
+    if row is not None and remaining != seen:
+        # Only clear the bitmap that was read; bits set since then stay
+        db.session.execute(update(SeenQuestions)
+                           .where(SeenQuestions.user_id == user_id, SeenQuestions.topic == topic,
+                                  SeenQuestions.level == level, SeenQuestions.mask == row.mask)
+                           .values(mask=b''))
+        db.session.commit()
+    return questions
+
+
+def mark_seen(user_id, topic, level, question_ids):
+    """Set the bits of answered or skipped questions. Call before committing.
+
+    The row is inserted, or updated only if its bitmap is still the one
+    read, so concurrent requests of the same player never drop each
+    other's bits.
+    """
+    if user_id is None:
+        return
+    bits = 0
+    for question_id in question_ids:
+        slot = question_bank.slot(topic, level, question_id)
+        if slot is not None:
+            bits |= 1 << slot
+    if not bits:
+        return
+
+    key = (SeenQuestions.user_id == user_id, SeenQuestions.topic == topic, SeenQuestions.level == level)
+    for _ in range(MARK_SEEN_RETRIES):
+        mask = db.session.execute(select(SeenQuestions.mask).where(*key)).scalar()
+        if mask is None:
+            # A request that added the row first wins; then set the bits on theirs
+            added = db.session.execute(
+                insert(SeenQuestions).prefix_with('OR IGNORE', dialect='sqlite').prefix_with('IGNORE', dialect='mysql')
+                .values(user_id=user_id, topic=topic, level=level, mask=_to_bytes(bits))
+            ).rowcount
+            if added:
+                return
+            continue
+        if _to_int(mask) | bits == _to_int(mask):
+            return
+        changed = db.session.execute(update(SeenQuestions).where(*key, SeenQuestions.mask == mask)
+                                     .values(mask=_to_bytes(_to_int(mask) | bits))).rowcount
+        if changed:
+            return
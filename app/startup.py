@@ -0,0 +1,21 @@
+# app/startup.py
+from app import db, question_bank
+from sqlalchemy.orm import configure_mappers
+
+
+def preload(app):
+    """Do the work each worker would otherwise repeat on its first requests.
+
+    Loads the question bank, compiles every template and sets up the ORM
+    mappers (otherwise done by the first query). Called in the master
+    of a pre-forking server (see wsgi.py and gunicorn.conf.py), workers then
+    share the result copy-on-write and serve their first request warm.
+    Database connections opened along the way are closed, since a forked
+    child must not reuse its parent's.
+    """
+    with app.app_context():
+        question_bank.version  # Reads and indexes the questions
+        configure_mappers()
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+        db.engine.dispose()
@@ -0,0 +1,43 @@
+# app/user_stats.py
+from app import db
+from app.models import UserStats, QuizAttempt
+from sqlalchemy import case, func
+
+
+def get_user_stats(user_id):
+    """Return the UserStats row for a user, computing it from history if missing"""
+    stats = db.session.get(UserStats, user_id)
+    if stats is not None:
+        return stats
+
+    # First visit since stats were introduced: one aggregate over the index
+    attempts, completed, best_score = db.session.query(
+        func.count(QuizAttempt.id),
+        func.coalesce(func.sum(case((QuizAttempt.is_complete, 1), else_=0)), 0),
+        func.max(case((QuizAttempt.is_complete, QuizAttempt.score)))
+    ).filter(QuizAttempt.user_id == user_id).one()
+
+    stats = UserStats(user_id=user_id, attempts=attempts, completed=completed, best_score=best_score)
+    db.session.add(stats)
+    db.session.commit()
+    return stats
+
+
+def record_attempt_started(user_id):
+    """Count a new attempt. Call before committing the attempt itself."""
+    # Users without a stats row yet get it computed from history later
+    UserStats.query.filter_by(user_id=user_id).update(
+        {UserStats.attempts: UserStats.attempts + 1}
+    )
+
+
+def record_attempt_finished(attempt):
+    """Count a finished attempt and its score. Call before committing it."""
+    UserStats.query.filter_by(user_id=attempt.user_id).update({
+        UserStats.completed: UserStats.completed + 1,
+        UserStats.best_score: case(
+            (UserStats.best_score.is_(None), attempt.score),
+            (UserStats.best_score < attempt.score, attempt.score),
+            else_=UserStats.best_score
+        )
+    })
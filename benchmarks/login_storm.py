@@ -0,0 +1,100 @@
+"""Quiz page latency during a burst of logins, inline vs pooled hashing.
+
+A set of threads keeps posting wrong passwords to /login (each from its own
+address, so the rate limiter doesn't step in) while one player fetches
+/question. Compares hashing on the request thread with the bounded pool.
+Run from the project root:
+
+    python benchmarks/login_storm.py --attackers 16 --seconds 5
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+
+
+def run(label, config, attackers, seconds):
+    with tempfile.TemporaryDirectory() as tmp:
+        config = dict(config, LOGIN_BURST=10 ** 6, AUTO_UPGRADE_SCHEMA=True,
+                      SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tmp, 'bench.db'))
+        app = create_app(config)
+
+        player = app.test_client()
+        player.post('/register', data={'username': 'victim', 'email': 'v@example.com', 'password': 'pw'})
+        player.get('/logout')
+        player.get('/start_quiz/Science')
+
+        stop = threading.Event()
+        logins = {'attempts': 0, 'refused': 0}
+
+        def attacker(n):
+            client = app.test_client()
+            while not stop.is_set():
+                response = client.post('/login', data={'username': 'victim', 'password': f'guess{n}'},
+                                       environ_base={'REMOTE_ADDR': f'10.0.{n // 250}.{n % 250}'})
+                logins['attempts'] += 1
+                if response.status_code == 503:
+                    logins['refused'] += 1
+
+        threads = [threading.Thread(target=attacker, args=(n,)) for n in range(attackers)]
+        for t in threads:
+            t.start()
+
+        latencies = []
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            player.get('/question')
+            latencies.append((time.perf_counter() - start) * 1000)
+            # Look like a player, not a refresh
+            time.sleep(0.05)
+
+        stop.set()
+        for t in threads:
+            t.join()
+        with app.app_context():
+            db.engine.dispose()
+
+    latencies.sort()
+    return {
+        'setup': label,
+        'attackers': attackers,
+        'question_requests': len(latencies),
+        'question_p50_ms': round(statistics.median(latencies), 1),
+        'question_p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 1),
+        'login_attempts': logins['attempts'],
+        'logins_refused': logins['refused'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--attackers', type=int, default=16, help='Threads posting logins')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    setups = [
+        ('inline', {'PASSWORD_HASH_WORKERS': 0}),
+        ('pooled', {}),
+    ]
+    results = [run(label, config, args.attackers, args.seconds) for label, config in setups]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(f"{r['setup']:>7}: /question p50 {r['question_p50_ms']} ms, p95 {r['question_p95_ms']} ms "
+              f"({r['question_requests']} requests); {r['login_attempts']} logins, {r['logins_refused']} refused")
+
+
+if __name__ == '__main__':
+    main()
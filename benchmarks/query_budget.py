@@ -0,0 +1,165 @@
+"""Query-count regression guard for the main routes.
+
+Plays one registered user through a full level against a throwaway
+database and checks that no route issues more SQL statements than its
+budget in QUERY_BUDGETS. Exits non-zero when a budget is exceeded, so it
+can run in CI:
+
+    python benchmarks/query_budget.py
+"""
+import os
+import re
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app, db, question_bank
+from app.quiz_session import DatabaseStore
+
+# The occasional purge of expired quiz sessions would make counts flaky
+DatabaseStore.purge_probability = 0
+
+_real_time = time.time
+
+# Maximum SQL statements per request, keyed by endpoint. Requests are made
+# as a logged-in user whose details are already in the user cache, so
+# current_user costs nothing.
+# level_complete includes the leaderboard writes of a player's first
+# finished attempt in each period (one INSERT per board). Answers and
+# skips read and update the player's seen-question bitmap (two statements,
+# none with RESPONSE_WRITE_BEHIND), and picking a level's questions reads it.
+QUERY_BUDGETS = {
+    'main.index': 1,
+    'main.topics': 1,
+    'main.start_quiz': 9,
+    'main.question': 2,
+    'main.submit_answer': 7,
+    'main.skip_question': 6,
+    'main.level_complete': 11,
+    'main.next_level': 5,
+    'api.question': 1,
+    'api.answer': 7,
+    'api.skip': 6,
+    'api.level_summary': 12,
+    'auth.profile': 3,
+    'auth.attempt_details': 4,
+}
+
+
+@contextmanager
+def count_queries(engine):
+    """Collect every SQL statement executed on `engine` inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+class BudgetClient:
+    """Wraps a test client and records the query count of each request"""
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+        self.counts = {}
+
+    def request(self, method, path, **kwargs):
+        with self.app.app_context():
+            engine = db.engine
+        with count_queries(engine) as statements:
+            response = self.client.open(path, method=method, **kwargs)
+        endpoint = self._endpoint(method, path)
+        self.counts[endpoint] = max(self.counts.get(endpoint, 0), len(statements))
+        return response
+
+    def _endpoint(self, method, path):
+        adapter = self.app.url_map.bind('localhost')
+        return adapter.match(path.split('?')[0], method=method)[0]
+
+
+def play_level(client):
+    """Answer every question of the current level correctly, skipping one"""
+    # Step past the refresh detection window between questions. The clock
+    # never goes back: the session cookie is signed with its time
+    start = time.time() - _real_time()
+    for i in range(10):
+        time.time = lambda offset=start + (i + 1) * 10: _real_time() + offset
+        html = client.request('GET', '/question').get_data(as_text=True)
+        question_id = re.search(r'data-question-id="(.*?)"', html).group(1)
+        if i == 0:
+            client.request('GET', f'/skip_question?question_id={question_id}')
+        else:
+            # Answered correctly, so the level is passed and the next one can be played
+            with client.app.app_context():
+                answer = question_bank.get(question_id)['correct_answer']
+            client.request('POST', '/submit_answer',
+                           data={'answer': answer, 'time_taken': '5', 'question_id': question_id})
+    return client.request('GET', '/level_complete')
+
+
+def play_level_api(client):
+    """Answer the current level through the JSON API, prefetching as the page does"""
+    current = client.request('GET', '/api/quiz/question/0').get_json()
+    for i in range(10):
+        client.request('GET', f'/api/quiz/question/{i + 1}')
+        if i == 0:
+            client.request('POST', '/api/quiz/skip', json={'question_id': current['question_id']})
+        else:
+            client.request('POST', '/api/quiz/answer', json={'question_id': current['question_id'],
+                                                            'answer': current['options'][0], 'time_taken': 5})
+        current = client.client.get(f'/api/quiz/question/{i + 1}').get_json()
+    return client.request('GET', '/api/quiz/level_summary')
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, 'budget.db'),
+                          'AUTO_UPGRADE_SCHEMA': True})
+        client = BudgetClient(app)
+
+        # Warm up the question bank so its load isn't charged to a route
+        with app.app_context():
+            question_bank.for_level('Science', 1)
+
+        client.client.post('/register', data={'username': 'budget', 'email': 'budget@example.com', 'password': 'pw'})
+        client.request('GET', '/')
+        client.request('GET', '/topics')
+        client.request('GET', '/start_quiz/Science')
+        play_level(client)
+        client.request('GET', '/next_level/2')
+        play_level_api(client)
+        client.request('GET', '/profile')
+        client.request('GET', '/attempt_details/1')
+
+        with app.app_context():
+            db.engine.dispose()
+
+    failures = 0
+    for endpoint, budget in sorted(QUERY_BUDGETS.items()):
+        count = client.counts.get(endpoint)
+        if count is None:
+            status = 'NOT RUN'
+            failures += 1
+        elif count > budget:
+            status = 'OVER BUDGET'
+            failures += 1
+        else:
+            status = 'ok'
+        print(f'{endpoint:<24} {count if count is not None else "-":>3} / {budget:<3} {status}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
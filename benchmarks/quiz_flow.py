@@ -0,0 +1,339 @@
+"""Load test of the full quiz flow with many concurrent players.
+
+Seeds a throwaway database with Faker users and attempt history, then has
+--users threads each log in and play --plays quizzes: start_quiz, ten
+question/submit_answer pairs per level, level_complete and next_level for
+--levels levels, then the profile page. Reports throughput and per-route
+p50/p95/p99 latency plus SQL statements per request (from the /metrics
+instrumentation). Requests go through the Flask test client, or over HTTP
+to a local threaded Werkzeug server with --server. Run from the project root:
+
+    python benchmarks/quiz_flow.py --users 8 --plays 3 --seed-users 2000
+    python benchmarks/quiz_flow.py --output before.json
+    python benchmarks/quiz_flow.py --compare before.json --set QUIZ_SESSION_BACKEND=memory
+    python benchmarks/quiz_flow.py --server --users 500 --think-ms 2000 --plays 1
+"""
+import argparse
+import html
+import http.cookiejar
+import json
+import logging
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db, metrics, password_hasher, question_bank
+from app.leaderboard import rebuild
+from app.models import User, Quiz, QuizAttempt, QuestionResponse
+from app.quiz_flow import QUESTIONS_PER_LEVEL
+from app.response_codec import encode_response
+from app.routes.main import TOPICS
+
+PASSWORD = 'benchmark'
+
+
+def seed(app, users, attempts_per_user, faker_seed):
+    """Fill the database with users and a realistic spread of past attempts"""
+    from faker import Faker
+    fake = Faker()
+    Faker.seed(faker_seed)
+    rng = random.Random(faker_seed)
+    now = datetime.utcnow()
+
+    with app.app_context():
+        # One hash for everybody: hashing each password would dominate seeding
+        password_hash = password_hasher.hash(PASSWORD)
+        db.session.execute(db.insert(User), [
+            {'username': f'player{i}', 'email': f'player{i}.{fake.free_email()}',
+             'password_hash': password_hash, 'is_admin': False}
+            for i in range(users)
+        ])
+        db.session.execute(db.insert(Quiz), [{'topic': topic} for topic in TOPICS
+                                             if not Quiz.query.filter_by(topic=topic).first()])
+        quiz_ids = {quiz.topic: quiz.id for quiz in Quiz.query}
+        user_ids = [row.id for row in db.session.query(User.id)]
+        db.session.commit()
+
+        for user_id in user_ids:
+            for _ in range(attempts_per_user):
+                topic = rng.choice(TOPICS)
+                level_reached = rng.randint(1, 3)
+                attempt = QuizAttempt(
+                    user_id=user_id, quiz_id=quiz_ids[topic], level_reached=level_reached,
+                    date_attempted=fake.date_time_between(now - timedelta(days=60), now),
+                    is_complete=rng.random() < 0.6)
+                db.session.add(attempt)
+                db.session.flush()
+
+                responses = []
+                for level in range(1, level_reached + 1):
+                    pool = question_bank.for_level(topic, level)
+                    for question in rng.sample(pool, min(QUESTIONS_PER_LEVEL, len(pool))):
+                        skipped = rng.random() < 0.05
+                        answer = None if skipped else rng.choice(question['options'])
+                        correct = answer == question['correct_answer']
+                        points = question['points'] if correct else (0 if skipped else -question['points'] // 2)
+                        attempt.score += points
+                        responses.append({
+                            'attempt_id': attempt.id, 'question_id': question['id'],
+                            'is_correct': correct, 'time_taken': rng.randint(2, 30), 'points': points,
+                            'level': level, 'topic': topic, 'possible_points': question['points'],
+                            **encode_response(question, question['options'][:4], answer),
+                        })
+                db.session.execute(db.insert(QuestionResponse), responses)
+            db.session.commit()
+
+        rebuild()
+
+
+class TestClient:
+    """Requests through the Flask test client, without following redirects"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.get_data(as_text=True)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpClient:
+    """Requests over HTTP with a cookie jar, without following redirects"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req) as response:
+                return response.status, response.read().decode()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode()
+
+
+class Recorder:
+    """Collects the latency of every request, per endpoint"""
+
+    def __init__(self, app):
+        self.adapter = app.url_map.bind('localhost')
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def timed(self, client, method, path, data=None):
+        start = time.perf_counter()
+        status, body = client.request(method, path, data)
+        elapsed = (time.perf_counter() - start) * 1000
+        endpoint = self.adapter.match(path, method=method)[0]
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(elapsed)
+            if status >= 400:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        return status, body
+
+
+def play(app, recorder, client, rng, levels, accuracy, think):
+    """One quiz from the topic list to the last level played"""
+    recorder.timed(client, 'GET', '/topics')
+    recorder.timed(client, 'GET', f'/start_quiz/{rng.choice(TOPICS)}')
+    for level in range(1, levels + 1):
+        if level > 1:
+            recorder.timed(client, 'GET', f'/next_level/{level}')
+        for _ in range(QUESTIONS_PER_LEVEL):
+            status, body = recorder.timed(client, 'GET', '/question')
+            match = re.search(r'data-question-id="(.*?)"', body)
+            if status != 200 or not match:
+                return
+            with app.app_context():
+                question = question_bank.get(html.unescape(match.group(1)))
+            options = [html.unescape(option) for option in re.findall(r'data-value="(.*?)"', body)]
+            answer = question['correct_answer'] if rng.random() < accuracy else rng.choice(options)
+            if think:
+                # Reading and answering time, +/- 50%, so players don't move in lockstep
+                time.sleep(think * rng.uniform(0.5, 1.5))
+            recorder.timed(client, 'POST', '/submit_answer',
+                           {'answer': answer, 'time_taken': str(rng.randint(2, 30)),
+                            'question_id': question['id']})
+        status, body = recorder.timed(client, 'GET', '/level_complete')
+        if f'/next_level/{level + 1}' not in body:
+            return
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values"""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def run(args, config):
+    with tempfile.TemporaryDirectory() as tmp:
+        config = dict({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, 'bench.db'),
+            'AUTO_UPGRADE_SCHEMA': True,
+            'METRICS_ENABLED': True,
+            # Every player logs in from the same address
+            'LOGIN_BURST': 10 ** 6,
+        }, **config)
+        app = create_app(config)
+
+        seed_start = time.perf_counter()
+        seed(app, args.seed_users, args.seed_attempts, args.faker_seed)
+        seed_seconds = time.perf_counter() - seed_start
+
+        server = None
+        if args.server:
+            from werkzeug.serving import make_server
+            logging.getLogger('werkzeug').setLevel(logging.ERROR)  # No line per request
+            server = make_server('127.0.0.1', 0, app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f'http://127.0.0.1:{server.server_port}'
+
+        recorder = Recorder(app)
+        failures = []
+
+        def player(n):
+            rng = random.Random(args.faker_seed + n)
+            client = HttpClient(base_url) if server else TestClient(app)
+            try:
+                recorder.timed(client, 'POST', '/login', {'username': f'player{n}', 'password': PASSWORD})
+                for _ in range(args.plays):
+                    play(app, recorder, client, rng, args.levels, args.accuracy, args.think_ms / 1000)
+                recorder.timed(client, 'GET', '/profile')
+            except Exception as e:
+                failures.append(f'player{n}: {e!r}')
+
+        # Measure from a warm start: the bank load and first connections aren't the flow
+        with app.app_context():
+            question_bank.for_level(TOPICS[0], 1)
+        metrics.reset()
+
+        threads = [threading.Thread(target=player, args=(n,)) for n in range(args.users)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        if server:
+            server.shutdown()
+        sql = metrics.summary()
+        with app.app_context():
+            db.engine.dispose()
+
+    routes = {}
+    for endpoint, latencies in sorted(recorder.latencies.items()):
+        latencies.sort()
+        routes[endpoint] = {
+            'requests': len(latencies),
+            'errors': recorder.errors.get(endpoint, 0),
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'max_ms': round(latencies[-1], 2),
+            **sql.get(endpoint, {}),
+        }
+    total = sum(route['requests'] for route in routes.values())
+    return {
+        'settings': {
+            'transport': 'http' if args.server else 'test_client',
+            'users': args.users, 'plays': args.plays, 'levels': args.levels, 'think_ms': args.think_ms,
+            'seed_users': args.seed_users, 'seed_attempts': args.seed_attempts,
+            'config': {key: value for key, value in config.items() if key != 'SQLALCHEMY_DATABASE_URI'},
+        },
+        'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'seed_seconds': round(seed_seconds, 2),
+        'seconds': round(elapsed, 3),
+        'requests': total,
+        'requests_per_sec': round(total / elapsed, 1),
+        'failures': failures,
+        'routes': routes,
+    }
+
+
+def parse_setting(text):
+    key, _, value = text.partition('=')
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass  # Plain strings needn't be quoted
+    return key, value
+
+
+def print_report(result, baseline=None):
+    print(f"{result['requests']} requests in {result['seconds']}s: {result['requests_per_sec']} req/s "
+          f"({result['settings']['users']} users, {result['settings']['transport']}; "
+          f"seeded in {result['seed_seconds']}s)")
+    if baseline:
+        print(f"  baseline: {baseline['requests_per_sec']} req/s")
+    print(f"{'route':<22} {'reqs':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'sql':>6} {'err':>4}")
+    for endpoint, route in result['routes'].items():
+        line = (f"{endpoint:<22} {route['requests']:>5} {route['p50_ms']:>8} {route['p95_ms']:>8} "
+                f"{route['p99_ms']:>8} {route.get('sql_statements', '-'):>6} {route['errors']:>4}")
+        old = (baseline or {}).get('routes', {}).get(endpoint)
+        if old:
+            line += f"   p95 {route['p95_ms'] - old['p95_ms']:+.2f} ms, sql {route.get('sql_statements', 0) - old.get('sql_statements', 0):+.2f}"
+        print(line)
+    for failure in result['failures']:
+        print('FAILED', failure)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=8, help='Concurrent players')
+    parser.add_argument('--plays', type=int, default=2, help='Quizzes each player starts')
+    parser.add_argument('--levels', type=int, default=2, help='Levels played per quiz, if passed')
+    parser.add_argument('--accuracy', type=float, default=0.9, help='Share of questions answered correctly')
+    parser.add_argument('--think-ms', type=int, default=0,
+                        help='Average pause before answering; with many --users this models real test-takers')
+    parser.add_argument('--seed-users', type=int, default=500)
+    parser.add_argument('--seed-attempts', type=int, default=4, help='Past attempts per seeded user')
+    parser.add_argument('--faker-seed', type=int, default=1)
+    parser.add_argument('--server', action='store_true', help='Go over HTTP to a local threaded server')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help='Config override, e.g. QUIZ_SESSION_BACKEND=memory (value parsed as JSON if it can be)')
+    parser.add_argument('--output', help='Also write the results as JSON to this file')
+    parser.add_argument('--compare', help='Results file of an earlier run to show differences against')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+    if args.seed_users < args.users:
+        parser.error('--seed-users must be at least --users')
+
+    result = run(args, dict(parse_setting(text) for text in args.set))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        baseline = None
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+        print_report(result, baseline)
+    sys.exit(1 if result['failures'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,409 @@
+"""Behaviour checks for quiz flow fixes that the query budget can't see.
+
+Each check builds the app against a throwaway database, drives it through
+the test client and asserts one behaviour that has regressed before.
+Exits non-zero when a check fails, so it can run in CI next to
+query_budget.py:
+
+    python benchmarks/regressions.py
+"""
+import os
+import sys
+import tempfile
+import time
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+
+CHECKS = []
+_apps = []
+
+
+def check(func):
+    CHECKS.append(func)
+    return func
+
+
+def make_app(tmp, **config):
+    config.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite:///' + os.path.join(tmp, 'checks.db'))
+    app = create_app(dict(config, AUTO_UPGRADE_SCHEMA=True, TESTING=True))
+    _apps.append(app)
+    return app
+
+
+def show_and_answer(client):
+    """Show the current question and answer it with its first option"""
+    page = client.get('/question')
+    assert page.status_code == 200, page.status_code
+    html = page.get_data(as_text=True)
+    option = html.split('data-value="', 1)[1].split('"', 1)[0]
+    question_id = html.split('data-question-id="', 1)[1].split('"', 1)[0]
+    client.post('/submit_answer', data={'answer': option, 'time_taken': '5', 'question_id': question_id})
+
+
+@check
+def refresh_resets_quiz(tmp):
+    """Reloading a question page within seconds ends the quiz"""
+    app = make_app(tmp)
+    client = app.test_client()
+    client.get('/start_quiz/Science')
+    show_and_answer(client)
+    assert client.get('/question').status_code == 200
+    response = client.get('/question')
+    assert response.status_code == 302 and response.location.endswith('/topics'), \
+        (response.status_code, response.location)
+
+
+@check
+def question_view_keeps_state_unwritten(tmp):
+    """Showing the question already on screen doesn't write the quiz state"""
+    from app import quiz_sessions
+    app = make_app(tmp)
+    client = app.test_client()
+    client.get('/start_quiz/Science')
+    assert client.get('/question').status_code == 200
+    writes = []
+    backend_set = quiz_sessions.backend.set
+    quiz_sessions.backend.set = lambda *args: writes.append(args) or backend_set(*args)
+    try:
+        assert client.get('/question').status_code == 200
+    finally:
+        del quiz_sessions.backend.set
+    assert not writes, writes
+
+
+@check
+def form_fallback_keeps_recorded_answer(tmp):
+    """The page's form fallback for an answer the API already recorded doesn't record it again"""
+    app = make_app(tmp)
+    client = app.test_client()
+    attempt_id = answer_some(app, client, 'Science', 1)
+    html = client.get('/question').get_data(as_text=True)
+    question_id = html.split('data-question-id="', 1)[1].split('"', 1)[0]
+    option = html.split('data-value="', 1)[1].split('"', 1)[0]
+    client.post('/api/quiz/answer', json={'question_id': question_id, 'answer': option, 'time_taken': 5})
+    before = attempt_rows(app, attempt_id)
+
+    client.post('/submit_answer', data={'answer': option, 'time_taken': '5', 'question_id': question_id})
+    client.get(f'/skip_question?question_id={question_id}')
+    assert attempt_rows(app, attempt_id) == before, (attempt_rows(app, attempt_id), before)
+    # Two questions answered, so question 2 is still the current one
+    assert client.get('/api/quiz/question/2').status_code == 200
+
+
+@check
+def levels_cannot_be_skipped(tmp):
+    """Jumping to a later level doesn't count as clearing the quiz"""
+    from app import question_bank
+    from app.models import QuizAttempt
+    app = make_app(tmp)
+    client = app.test_client()
+    attempt_id = answer_some(app, client, 'Science', 0)
+    client.get('/next_level/4')
+    for _ in range(10):
+        html = client.get('/question').get_data(as_text=True)
+        question_id = html.split('data-question-id="', 1)[1].split('"', 1)[0]
+        with app.app_context():
+            question = question_bank.get(question_id)
+        assert question['level'] == 1, question['level']
+        client.post('/submit_answer', data={'answer': question['correct_answer'], 'time_taken': '5',
+                                            'question_id': question_id})
+    client.get('/level_complete')
+    with app.app_context():
+        attempt = db.session.get(QuizAttempt, attempt_id)
+        assert (attempt.level_reached, attempt.is_complete) == (2, False), \
+            (attempt.level_reached, attempt.is_complete)
+
+
+@check
+def in_memory_sqlite_boots(tmp):
+    """The usual test configuration, an in-memory SQLite database, still starts and serves"""
+    for uri in ('sqlite://', 'sqlite:///:memory:'):
+        app = make_app(tmp, SQLALCHEMY_DATABASE_URI=uri)
+        client = app.test_client()
+        assert client.get('/start_quiz/Science').status_code == 302
+        show_and_answer(client)
+
+
+@check
+def metrics_survive_failed_statements(tmp):
+    """A failing SQL statement doesn't leave its start time behind to skew later timings"""
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    app = make_app(tmp, METRICS_ENABLED=True)
+    with app.app_context():
+        with db.engine.connect() as conn:
+            try:
+                conn.execute(text('SELECT * FROM no_such_table'))
+            except OperationalError:
+                pass
+            conn.execute(text('SELECT 1'))
+            assert not conn.info.get('metrics_start'), conn.info.get('metrics_start')
+
+
+@check
+def password_hashing_leaves_request_threads(tmp):
+    """Logins waiting on the hashing pool never hold every request thread; the rest are refused"""
+    import threading
+    from app import password_hasher
+    from app.security import HashingBusy
+    for config in ({}, {'PASSWORD_HASH_WORKERS': 4, 'PASSWORD_HASH_QUEUE': 16}):
+        make_app(tmp, REQUEST_THREADS=8, **config)
+        release = threading.Event()
+        held, refused = [], []
+
+        def login():
+            try:
+                password_hasher._run(lambda: held.append(1) or release.wait(5))
+            except HashingBusy:
+                refused.append(1)
+
+        threads = [threading.Thread(target=login) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert 0 < len(held) < 8 and len(refused) == 8 - len(held), (config, len(held), len(refused))
+
+
+def attempt_rows(app, attempt_id):
+    """(responses stored, score) of an attempt"""
+    from app.models import QuestionResponse, QuizAttempt
+    with app.app_context():
+        return (QuestionResponse.query.filter_by(attempt_id=attempt_id).count(),
+                db.session.get(QuizAttempt, attempt_id).score)
+
+
+def answer_some(app, client, topic, count):
+    """Start a quiz and answer `count` questions; returns the attempt id"""
+    client.get(f'/start_quiz/{topic}')
+    for _ in range(count):
+        show_and_answer(client)
+    with client.session_transaction() as session:
+        return session['attempt_id']
+
+
+@check
+def write_behind_flushes_replaced_quiz(tmp):
+    """Starting another quiz mid-level writes the buffered answers of the first"""
+    app = make_app(tmp, RESPONSE_WRITE_BEHIND=True)
+    client = app.test_client()
+    first = answer_some(app, client, 'Science', 5)
+    assert attempt_rows(app, first)[0] == 0
+    client.get('/start_quiz/History')
+    responses, score = attempt_rows(app, first)
+    assert responses == 5, responses
+    with app.app_context():
+        from app.models import QuestionResponse
+        expected = db.session.query(db.func.sum(QuestionResponse.points)).filter_by(attempt_id=first).scalar()
+    assert score == expected, (score, expected)
+
+
+@check
+def write_behind_sweeps_idle_and_evicted(tmp):
+    """Idle buffers and buffers of evicted in-memory states are flushed by the sweep"""
+    from app import quiz_sessions
+    for backend in ('database', 'memory'):
+        app = make_app(tmp, RESPONSE_WRITE_BEHIND=True, QUIZ_SESSION_BACKEND=backend,
+                       QUIZ_SESSION_MAX_ENTRIES=1, RESPONSE_FLUSH_INTERVAL=0.2,
+                       SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tmp, backend + '.db'))
+        idle = answer_some(app, app.test_client(), 'Science', 3)
+        # With one memory slot this start evicts the first player's state
+        other = app.test_client()
+        busy = answer_some(app, other, 'History', 2)
+        time.sleep(0.3)
+        other.get('/topics')  # Any request runs the sweep once the interval has passed
+        assert attempt_rows(app, idle)[0] == 3, (backend, attempt_rows(app, idle))
+        assert attempt_rows(app, busy)[0] == 2, (backend, attempt_rows(app, busy))
+        with app.app_context():
+            assert quiz_sessions.sweep(0) == 0
+
+
+@check
+def write_behind_flushes_once(tmp):
+    """A buffer flushed by the sweep and again by the player's request is written once"""
+    from app import quiz_sessions
+    from app.models import QuestionResponse
+    from app.quiz_flow import flush_responses
+    from app.quiz_session import QuizState
+    app = make_app(tmp, RESPONSE_WRITE_BEHIND=True)
+    attempt_id = answer_some(app, app.test_client(), 'Science', 3)
+    with app.app_context():
+        request_copy = QuizState(attempt_id, quiz_sessions.backend.get(str(attempt_id)))
+        assert quiz_sessions.sweep(0) == 1
+        flush_responses(request_copy)
+        expected = db.session.query(db.func.sum(QuestionResponse.points)).filter_by(attempt_id=attempt_id).scalar()
+    responses, score = attempt_rows(app, attempt_id)
+    assert (responses, score) == (3, expected), (responses, score, expected)
+
+
+@check
+def edited_options_keep_old_answers(tmp):
+    """Reordering a question's options doesn't change the answers recorded before"""
+    import json
+    import shutil
+    from app.reports import build_level_reports
+    questions_file = os.path.join(tmp, 'questions.json')
+    shutil.copy(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'questions.json'),
+                questions_file)
+    app = make_app(tmp, QUESTIONS_FILE=questions_file, QUESTION_BANK_RELOAD_INTERVAL=0)
+    attempt_id = answer_some(app, app.test_client(), 'Science', 3)
+
+    def answers():
+        with app.app_context():
+            report = build_level_reports(attempt_id)[1]['responses']
+            return [(r['text'], r['user_answer'], tuple(r['options'])) for r in report]
+
+    before = answers()
+    with open(questions_file, encoding='utf-8') as f:
+        questions = json.load(f)
+    for question in questions:
+        question['options'].reverse()
+    with open(questions_file, 'w', encoding='utf-8') as f:
+        json.dump(questions, f)
+    os.utime(questions_file, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+
+    assert answers() == before, (answers(), before)
+    with app.app_context():
+        from app.migrations import compact_responses
+        compact_responses()
+    assert answers() == before, (answers(), before)
+
+
+@check
+def seen_bits_survive_pool_edits(tmp):
+    """Removing a question from the middle of a level doesn't hand its seen bit to another"""
+    import json
+    import shutil
+    from app.models import User
+    from app.seen_questions import choose_questions, mark_seen
+    questions_file = os.path.join(tmp, 'questions.json')
+    shutil.copy(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'questions.json'),
+                questions_file)
+    app = make_app(tmp, QUESTIONS_FILE=questions_file, QUESTION_BANK_RELOAD_INTERVAL=0)
+    with open(questions_file, encoding='utf-8') as f:
+        questions = json.load(f)
+    pool = [q['id'] for q in questions if q['topic'] == 'Science' and q['level'] == 1]
+    unseen = set(pool[-3:])
+
+    with app.app_context():
+        user = User(username='seen', email='seen@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        mark_seen(user_id, 'Science', 1, pool[:-3])
+        db.session.commit()
+
+    with open(questions_file, 'w', encoding='utf-8') as f:
+        json.dump([q for q in questions if q['id'] != pool[1]], f)
+    os.utime(questions_file, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+
+    with app.app_context():
+        picked = {q['id'] for q in choose_questions(user_id, 'Science', 1, 3)}
+    assert picked == unseen, (picked, unseen)
+
+
+@check
+def mark_seen_concurrent_requests(tmp):
+    """Requests of the same player marking questions at once keep every bit"""
+    import threading
+    from app import question_bank
+    from app.models import SeenQuestions, User
+    from app.seen_questions import mark_seen
+    app = make_app(tmp)
+    with app.app_context():
+        user = User(username='seen', email='seen@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        pool = [q['id'] for q in question_bank.for_level('Science', 1)]
+
+    errors = []
+
+    def mark(question_id):
+        try:
+            with app.app_context():
+                mark_seen(user_id, 'Science', 1, [question_id])
+                db.session.commit()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=mark, args=(question_id,)) for question_id in pool]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+    with app.app_context():
+        mask = int.from_bytes(db.session.get(SeenQuestions, (user_id, 'Science', 1)).mask, 'little')
+    assert mask.bit_count() == len(pool), (mask.bit_count(), len(pool))
+
+
+@check
+def full_analytics_rebuild_counts_archived(tmp):
+    """`analytics update --full` after archiving still counts the archived responses"""
+    from datetime import datetime, timedelta
+    from app.analytics import reset_question_stats, update_question_stats
+    from app.archive import archive_attempts
+    from app.models import QuestionStats, QuizAttempt
+    app = make_app(tmp, ARCHIVE_DIR=os.path.join(tmp, 'archive'))
+    for topic in ('Science', 'History', 'Technology'):
+        answer_some(app, app.test_client(), topic, 4)
+
+    def stats():
+        return sorted((s.question_id, s.answered, s.skipped, s.correct, s.time_total, s.time_histogram,
+                       s.distractor_counts) for s in QuestionStats.query)
+
+    with app.app_context():
+        QuizAttempt.query.update({QuizAttempt.date_attempted: datetime.utcnow() - timedelta(days=60)})
+        db.session.commit()
+        update_question_stats()
+        before = stats()
+        assert archive_attempts(days=30) == 2
+        assert reset_question_stats() == 8
+        update_question_stats()
+        assert stats() == before, (stats(), before)
+
+
+@check
+def upgrade_reports_older_responses(tmp):
+    """Responses recorded before the level column existed show up in reports after upgrading"""
+    from app.migrations import upgrade_schema
+    from app.models import QuestionResponse
+    from app.reports import level_totals
+    app = make_app(tmp)
+    attempt_id = answer_some(app, app.test_client(), 'Science', 3)
+    with app.app_context():
+        QuestionResponse.query.update({QuestionResponse.level: None, QuestionResponse.topic: None,
+                                       QuestionResponse.possible_points: None})
+        db.session.commit()
+        upgrade_schema()
+        totals = level_totals(attempt_id)
+    assert totals and totals[1]['total_questions'] == 3, totals
+
+
+def main():
+    failures = 0
+    for func in CHECKS:
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                func(tmp)
+                status = 'ok'
+            except Exception:
+                failures += 1
+                status = 'FAILED\n' + traceback.format_exc()
+            finally:
+                while _apps:
+                    with _apps.pop().app_context():
+                        db.engine.dispose()
+        print(f'{func.__name__:<40} {status}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Concurrent write throughput of the SQLite setup, default vs tuned.
+
+Each worker thread records answers the way submit_answer does: insert a
+QuestionResponse, bump the attempt score, commit. Run from the project root:
+
+    python benchmarks/sqlite_writes.py --threads 8 --writes 200
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.exc import OperationalError
+
+from app import create_app, db
+from app.models import Quiz, QuizAttempt, QuestionResponse
+
+
+def run(label, config, threads, writes):
+    with tempfile.TemporaryDirectory() as tmp:
+        config = dict(config, AUTO_UPGRADE_SCHEMA=True,
+                      SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tmp, 'bench.db'))
+        app = create_app(config)
+
+        with app.app_context():
+            quiz = Quiz(topic='Science')
+            db.session.add(quiz)
+            db.session.commit()
+            attempt_ids = []
+            for _ in range(threads):
+                attempt = QuizAttempt(quiz_id=quiz.id)
+                db.session.add(attempt)
+                db.session.commit()
+                attempt_ids.append(attempt.id)
+
+        errors = []
+
+        def worker(attempt_id):
+            with app.app_context():
+                for i in range(writes):
+                    try:
+                        db.session.add(QuestionResponse(
+                            attempt_id=attempt_id, question_id=f'sci_1_{i % 30 + 1}',
+                            user_answer='Leaf', is_correct=True, time_taken=5, points=10,
+                            presented_options='["Root", "Stem", "Flower", "Leaf"]',
+                            level=1, topic='Science', possible_points=10))
+                        attempt = db.session.get(QuizAttempt, attempt_id)
+                        attempt.score += 10
+                        db.session.commit()
+                    except OperationalError as exc:
+                        db.session.rollback()
+                        errors.append(str(exc.orig))
+
+        workers = [threading.Thread(target=worker, args=(aid,)) for aid in attempt_ids]
+        start = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        with app.app_context():
+            db.engine.dispose()
+
+    committed = threads * writes - len(errors)
+    return {
+        'setup': label,
+        'threads': threads,
+        'committed': committed,
+        'errors': len(errors),
+        'seconds': round(elapsed, 3),
+        'writes_per_sec': round(committed / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=200, help='Commits per thread')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    setups = [
+        # What create_app used before: rollback journal, FULL sync, default pool
+        ('default', {'SQLITE_PRAGMAS': {}, 'SQLALCHEMY_ENGINE_OPTIONS': {}}),
+        ('tuned', {}),
+    ]
+    results = [run(label, config, args.threads, args.writes) for label, config in setups]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(f"{r['setup']:>8}: {r['writes_per_sec']:>8} writes/sec "
+              f"({r['committed']} commits, {r['errors']} errors, {r['seconds']}s, {r['threads']} threads)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Worker startup cost: boot time and first-request latency of a new worker.
+
+Compares a worker that builds the app itself, with and without the schema
+upgrade create_app used to run, against workers forked from a master that
+built the app (optionally preloaded, as gunicorn.conf.py does). Each setup
+runs in a fresh interpreter so imports are counted. Run from the project root:
+
+    python benchmarks/startup.py --workers 4
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def first_requests(app):
+    """Time a new quiz taker's first requests, then the same requests again warm"""
+    client = app.test_client()
+    timings = []
+    for _ in range(2):
+        start = time.perf_counter()
+        client.get('/topics')
+        client.get('/start_quiz/Science')
+        client.get('/question')
+        timings.append(round((time.perf_counter() - start) * 1000, 1))
+    return timings
+
+
+def report(**values):
+    # Written straight to the file descriptor: forked workers exit without flushing stdout
+    os.write(1, (json.dumps(values) + '\n').encode())
+
+
+def worker(setup, workers):
+    """Runs in a fresh interpreter: boot the way `setup` does and time the first requests"""
+    start = time.perf_counter()
+    from app import create_app, db
+    app = create_app({'AUTO_UPGRADE_SCHEMA': setup == 'cold'})
+
+    if setup in ('cold', 'no-upgrade'):
+        boot = (time.perf_counter() - start) * 1000
+        first, warm = first_requests(app)
+        report(boot_ms=round(boot, 1), first_ms=first, warm_ms=warm)
+        return
+
+    if setup == 'fork-preload':
+        from app.startup import preload
+        preload(app)
+    boot = (time.perf_counter() - start) * 1000
+
+    # One worker at a time, so they don't compete for the CPU
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            with app.app_context():
+                db.engine.dispose(close=False)
+            first, warm = first_requests(app)
+            report(boot_ms=round(boot, 1), first_ms=first, warm_ms=warm)
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+
+def run(setup, workers, env):
+    rows = []
+    runs = 1 if setup.startswith('fork') else workers
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, __file__, '--worker', setup, '--workers', str(workers)],
+                                env=env, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        rows += [json.loads(line) for line in output.splitlines() if line.startswith('{')]
+    return {
+        'setup': setup,
+        'workers': len(rows),
+        'boot_ms': round(statistics.median(row['boot_ms'] for row in rows), 1),
+        'first_request_ms': round(statistics.median(row['first_ms'] for row in rows), 1),
+        'first_request_max_ms': max(row['first_ms'] for row in rows),
+        'warm_request_ms': round(statistics.median(row['warm_ms'] for row in rows), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help='Workers started per setup')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.workers)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(tmp, 'startup.db'))
+        # The deploy step: create the schema once
+        subprocess.run([sys.executable, '-c', 'from app import create_app; create_app({"AUTO_UPGRADE_SCHEMA": True})'],
+                       env=env, cwd=ROOT, check=True)
+        results = [run(setup, args.workers, env) for setup in ('cold', 'no-upgrade', 'fork', 'fork-preload')]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(f"{r['setup']:>12}: boot {r['boot_ms']:>6} ms, first requests {r['first_request_ms']:>6} ms "
+              f"(max {r['first_request_max_ms']}), warm {r['warm_request_ms']} ms; {r['workers']} workers")
+    print('Forked workers boot once in the master; their first requests follow the fork immediately.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+# gunicorn.conf.py
+# `gunicorn -c gunicorn.conf.py wsgi:app`. The app is built and warmed once in
+# the master (preload_app), then forked, so new workers start serving at once.
+import gc
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+preload_app = True
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's reach, so collections
+    # in the workers don't touch (and copy) the pages shared with the master
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Never reuse a connection inherited from the master
+    from app import db
+    from wsgi import app
+    with app.app_context():
+        db.engine.dispose(close=False)
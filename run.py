@@ -1,8 +1,10 @@
 # run.py
+# Development server with the debugger and reloader; production uses wsgi.py
 from app import create_app, db
 from app.models import User, Quiz, QuizAttempt, QuestionResponse
 
-app = create_app()
+# Creates and upgrades the schema on startup; production runs `flask db upgrade`
+app = create_app({'AUTO_UPGRADE_SCHEMA': True})
 
 @app.shell_context_processor
 def make_shell_context():
@@ -0,0 +1,9 @@
+# wsgi.py
+# Production entry point for a WSGI server, e.g. `gunicorn -c gunicorn.conf.py wsgi:app`.
+# run.py starts Flask's debug server and is for development only. Workers
+# don't touch the schema: run `flask --app run.py db upgrade` on deploy first.
+from app import create_app
+from app.startup import preload
+
+app = create_app()
+preload(app)